@@ -0,0 +1,111 @@
+""" Event loop latency under concurrent query load
+
+A ticker coroutine sleeps for 1 ms in a loop and records how late it wakes up
+while other coroutines run queries either blocking the loop
+or with the async facade of PooledSqliteDatabase.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_async.py [--rows N] [--clients N]
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from ormik import db
+
+from schema import Author, Book, setup_database, teardown_database, \
+    temp_db_path
+
+
+TICK = 0.001
+
+
+def parse_user_settings():
+    parser = argparse.ArgumentParser(
+        description='Benchmark event loop latency under query load.'
+    )
+    parser.add_argument(
+        '--rows', default=20000, type=int,
+        help='Number of books (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--clients', default=8, type=int,
+        help='Number of concurrent clients (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--queries', default=5, type=int,
+        help='Queries per client (default: %(default)s)'
+    )
+    return parser.parse_args()
+
+
+async def ticker(lags, stop):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - started - TICK)
+
+
+async def blocking_client(queries):
+    for _ in range(queries):
+        Book.filter(pages__gt=50).select_related('author').select_all()
+        await asyncio.sleep(0)
+
+
+async def async_client(queries):
+    for _ in range(queries):
+        await Book.filter(pages__gt=50).select_related(
+            'author'
+        ).aselect_all()
+
+
+async def measure(client, clients, queries):
+    lags, stop = [], asyncio.Event()
+    ticker_task = asyncio.ensure_future(ticker(lags, stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[client(queries) for _ in range(clients)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker_task
+    return elapsed, lags
+
+
+def report(label, elapsed, lags):
+    lags = sorted(lags) or [0]
+    p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))]
+    print(
+        f'{label:<20} total {elapsed:>7.2f}s  '
+        f'loop lag: median {statistics.median(lags) * 1000:>7.2f}ms  '
+        f'p99 {p99 * 1000:>7.2f}ms  max {lags[-1] * 1000:>7.2f}ms'
+    )
+
+
+def main():
+    user_settings = parse_user_settings()
+    database = setup_database(
+        temp_db_path(), db_cls=db.PooledSqliteDatabase,
+        max_connections=user_settings.clients + 1,
+        async_workers=user_settings.clients
+    )
+    try:
+        author = Author.create(name='William Gibson')
+        Book.bulk_create([
+            Book(author=author, title=f'Book {i}', pages=i % 200)
+            for i in range(user_settings.rows)
+        ])
+        loop = asyncio.new_event_loop()
+        for label, client in (
+            ('blocking queries', blocking_client),
+            ('async facade', async_client),
+        ):
+            report(label, *loop.run_until_complete(measure(
+                client, user_settings.clients, user_settings.queries
+            )))
+        loop.close()
+    finally:
+        teardown_database(database, remove_file=True)
+
+
+if __name__ == '__main__':
+    main()
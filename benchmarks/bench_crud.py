@@ -0,0 +1,151 @@
+""" CRUD hot paths of Author/Book schema at several table sizes
+
+Every case reports rows processed per second, peak memory traced
+while it runs and the number of statements executed.
+Cases run in order on the same data, update and delete go last.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_crud.py \
+        [--rows 1000 100000 1000000] [--db memory file] [--no-memory]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from schema import Author, Book, setup_database, teardown_database, \
+    temp_db_path
+
+AUTHORS = 100
+INSERT_BATCH_SIZE = 10000
+
+
+def parse_user_settings():
+    parser = argparse.ArgumentParser(
+        description='Benchmark ormik CRUD operations.'
+    )
+    parser.add_argument(
+        '--rows', default=[1000, 100000], type=int, nargs='+',
+        help='Numbers of books (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--db', default=['memory', 'file'], nargs='+',
+        choices=['memory', 'file'],
+        help='Databases to run against (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--pragmas', default='default', type=str,
+        help='PRAGMAs profile (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--no-memory', action='store_true',
+        help='Do not trace memory: tracemalloc slows Python code down'
+    )
+    return parser.parse_args()
+
+
+class QueryCounter:
+
+    def __init__(self, database):
+        self.count = 0
+        database.after_execute(self)
+
+    def __call__(self, query):
+        self.count += 1
+
+
+def insert(rows):
+    authors = Author.bulk_create([
+        Author(name=f'Author {i}') for i in range(AUTHORS)
+    ])
+    for start in range(0, rows, INSERT_BATCH_SIZE):
+        Book.bulk_create([
+            Book(
+                author=authors[i % AUTHORS], title=f'Book {i}',
+                pages=i % 1000 + 1
+            ) for i in range(start, min(start + INSERT_BATCH_SIZE, rows))
+        ])
+    return rows + AUTHORS
+
+
+def select_all(rows):
+    return len(Book.select_related('author').select_all())
+
+
+def values(rows):
+    return len(Book.values('id', 'title', 'pages'))
+
+
+def filter_fk_join(rows):
+    return len(Book.filter(
+        author__name='Author 7', pages__gt=500
+    ).select_related('author').select_all())
+
+
+def reverse_relation(rows):
+    count = 0
+    for author in Author.select_all():
+        for book in author.books.select_related('author'):
+            count += 1
+    return count
+
+
+def reverse_relation_prefetch(rows):
+    count = 0
+    for author in Author.prefetch_related('books'):
+        for book in author.books:
+            count += 1
+    return count
+
+
+def update_range(rows):
+    return Book.filter(id__lte=rows // 2).update(rating=5)
+
+
+def delete_range(rows):
+    return Book.filter(id__gt=rows // 2).delete()
+
+
+CASES = [
+    insert, select_all, values, filter_fk_join, reverse_relation,
+    reverse_relation_prefetch, update_range, delete_range,
+]
+
+
+def run(case, rows, counter, trace_memory):
+    gc.collect()
+    counter.count = 0
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    processed = case(rows)
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(
+        f'  {case.__name__:<25} {processed:>9} rows '
+        f'{processed / elapsed:>12.0f} rows/sec '
+        f'peak {peak / 2 ** 20:>8.1f}Mb '
+        f'{counter.count:>7} queries'
+    )
+
+
+def main():
+    user_settings = parse_user_settings()
+    for db_kind in user_settings.db:
+        for rows in user_settings.rows:
+            db_path = ':memory:' if db_kind == 'memory' else temp_db_path()
+            database = setup_database(db_path, pragmas=user_settings.pragmas)
+            counter = QueryCounter(database)
+            print(f'{db_kind} db, {rows} books:')
+            try:
+                for case in CASES:
+                    run(case, rows, counter, not user_settings.no_memory)
+            finally:
+                teardown_database(database, remove_file=db_kind == 'file')
+
+
+if __name__ == '__main__':
+    main()
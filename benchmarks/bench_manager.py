@@ -0,0 +1,91 @@
+""" Per-call overhead of model class query methods
+
+Model class methods are bound to QueryManager at register_models().
+They are compared with the former lookup of ModelMeta.__getattr__,
+which made a QuerySet and a wrapper on every call.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_manager.py [--calls N] [--repeat N]
+"""
+import argparse
+import timeit
+
+from schema import Author, Book, setup_database, teardown_database
+
+
+def parse_user_settings():
+    parser = argparse.ArgumentParser(
+        description='Benchmark ormik model class query methods.'
+    )
+    parser.add_argument(
+        '--calls', default=20000, type=int,
+        help='Number of calls of each method (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--repeat', default=5, type=int,
+        help='Number of timings, the minimum is reported '
+             '(default: %(default)s)'
+    )
+    return parser.parse_args()
+
+
+def getattr_per_call(model, attr):
+    """ Former ModelMeta.__getattr__ """
+    qs = model.query_manager.get_queryset()
+    if hasattr(qs, attr):
+        def wrapper(*args, **kwargs):
+            return getattr(qs, attr)(*args, **kwargs)
+        return wrapper
+    raise AttributeError(attr)
+
+
+CASES = {
+    'filter': (
+        lambda: Book.filter(pages__gt=10),
+        lambda: getattr_per_call(Book, 'filter')(pages__gt=10),
+    ),
+    'get': (
+        lambda: Author.get(id=1),
+        lambda: getattr_per_call(Author, 'get')(id=1),
+    ),
+    'create': (
+        lambda: Author.create(name='Author'),
+        lambda: getattr_per_call(Author, 'create')(name='Author'),
+    ),
+}
+
+
+def best_times(funcs, calls, repeat):
+    """ Minimum time of each function,
+    timings are interleaved so that load changes affect all of them
+    """
+    timings = [
+        [timeit.timeit(func, number=calls) for func in funcs]
+        for _ in range(repeat)
+    ]
+    return [min(func_timings) for func_timings in zip(*timings)]
+
+
+def main():
+    user_settings = parse_user_settings()
+    calls, repeat = user_settings.calls, user_settings.repeat
+    database = setup_database()
+    Author.create(name='Author')
+    try:
+        with database.atomic():
+            for name, (manager_call, getattr_call) in CASES.items():
+                manager_time, getattr_time = best_times(
+                    (manager_call, getattr_call), calls, repeat
+                )
+                print(
+                    f'{name:<8} '
+                    f'manager {manager_time / calls * 1e6:>8.2f}us/call  '
+                    f'__getattr__ {getattr_time / calls * 1e6:>8.2f}us/call  '
+                    f'x{getattr_time / manager_time:.2f}'
+                )
+    finally:
+        teardown_database(database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+""" Memory of selected model instances: __dict__ vs compact __slots__
+
+Book of the test ORM project makes empty Author instances for NULL FKs,
+so its lazy FK variants are compared too.
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_memory.py [--rows N]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from ormik import fields, models, sql
+
+from schema import Author, Book, setup_database, teardown_database
+
+
+class LazyBook(models.Model):
+    """ Book with lazy FKs """
+    __tablename__ = 'good_books'
+
+    id = fields.AutoField()
+    author = fields.ForeignKeyField(
+        Author, 'lazy_books', on_delete=sql.CASCADE, lazy=True
+    )
+    title = fields.CharField(default='Title')
+    pages = fields.IntegerField(default=100)
+    coauthor = fields.ForeignKeyField(
+        Author, 'lazy_cobooks', on_delete=sql.NO_ACTION, lazy=True
+    )
+    rating = fields.IntegerField(default=10)
+    name = fields.CharField(default='Book name')
+
+
+class CompactBook(models.Model):
+    """ LazyBook storing fields values in __slots__ """
+    __tablename__ = 'good_books'
+    __compact__ = True
+
+    id = fields.AutoField()
+    author = fields.ForeignKeyField(
+        Author, 'compact_books', on_delete=sql.CASCADE, lazy=True
+    )
+    title = fields.CharField(default='Title')
+    pages = fields.IntegerField(default=100)
+    coauthor = fields.ForeignKeyField(
+        Author, 'compact_cobooks', on_delete=sql.NO_ACTION, lazy=True
+    )
+    rating = fields.IntegerField(default=10)
+    name = fields.CharField(default='Book name')
+
+
+def parse_user_settings():
+    parser = argparse.ArgumentParser(
+        description='Benchmark memory of selected model instances.'
+    )
+    parser.add_argument(
+        '--rows', default=100000, type=int,
+        help='Number of books (default: %(default)s)'
+    )
+    return parser.parse_args()
+
+
+def measure(label, model, rows):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    instances = model.select_all()
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(instances) == rows
+    print(
+        f'{label:<28} {current / rows:>8.0f} bytes/row  '
+        f'peak {peak / 2 ** 20:>8.1f}Mb  {rows / elapsed:>10.0f} rows/sec'
+    )
+    return current
+
+
+def main():
+    user_settings = parse_user_settings()
+    rows = user_settings.rows
+    database = setup_database()
+    database.register_models([LazyBook, CompactBook])
+    try:
+        author = Author.create(name='William Gibson')
+        LazyBook.bulk_create([
+            LazyBook(author=author.id, title=f'Book {i}', pages=i)
+            for i in range(rows)
+        ])
+        measure('Book (eager FKs)', Book, rows)
+        measure('LazyBook (__dict__)', LazyBook, rows)
+        measure('CompactBook (__slots__)', CompactBook, rows)
+    finally:
+        teardown_database(database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+""" Write throughput with and without db.atomic()
+
+Usage:
+    PYTHONPATH=. python benchmarks/bench_transactions.py [--rows N] [--db PATH]
+"""
+import argparse
+import time
+
+from schema import Author, setup_database, teardown_database, temp_db_path
+
+
+def parse_user_settings():
+    parser = argparse.ArgumentParser(
+        description='Benchmark ormik write throughput in transactions.'
+    )
+    parser.add_argument(
+        '--rows', default=1000, type=int,
+        help='Number of rows to insert (default: %(default)s)'
+    )
+    parser.add_argument(
+        '--db', default=None, type=str,
+        help='Database file (default: temporary file)'
+    )
+    return parser.parse_args()
+
+
+def insert_authors(rows):
+    for i in range(rows):
+        Author.create(name=f'Author {i}')
+
+
+def run(label, rows, func):
+    started = time.perf_counter()
+    func(rows)
+    elapsed = time.perf_counter() - started
+    print(f'{label:<40} {rows / elapsed:>12.0f} rows/sec')
+
+
+def main():
+    user_settings = parse_user_settings()
+    database = setup_database(user_settings.db or temp_db_path())
+    rows = user_settings.rows
+    try:
+        run('create(), commit per statement', rows, insert_authors)
+        run(
+            'create() in db.atomic()', rows,
+            database.atomic()(insert_authors)
+        )
+        run(
+            'bulk_create()', rows,
+            lambda rows: Author.bulk_create(
+                [Author(name=f'Author {i}') for i in range(rows)]
+            )
+        )
+    finally:
+        teardown_database(database, remove_file=user_settings.db is None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+""" Author/Book schema of bin/orm.py shared by benchmarks """
+import os
+import tempfile
+
+from ormik import fields, models, db, sql
+
+
+class Author(models.Model):
+
+    id = fields.AutoField()
+    name = fields.CharField()
+
+
+class Book(models.Model):
+    __tablename__ = 'good_books'
+
+    id = fields.AutoField()
+    author = fields.ForeignKeyField(
+        Author, 'books', is_nullable=True, on_delete=sql.CASCADE
+    )
+    title = fields.CharField(default='Title')
+    pages = fields.IntegerField(default=100)
+    coauthor = fields.ForeignKeyField(
+        Author, 'cobooks', is_nullable=True, on_delete=sql.NO_ACTION
+    )
+    rating = fields.IntegerField(default=10)
+    name = fields.CharField(default='Book name')
+
+
+def temp_db_path():
+    fd, path = tempfile.mkstemp(prefix='ormik-bench-', suffix='.db')
+    os.close(fd)
+    os.remove(path)
+    return path
+
+
+def setup_database(database=':memory:', db_cls=db.SqliteDatabase, **kwargs):
+    """ Register Author and Book in a new database and create tables """
+    database = db_cls(database, **kwargs)
+    database.register_models([Author, Book])
+    Author.create_table()
+    Book.create_table()
+    return database
+
+
+def teardown_database(database, remove_file=False):
+    database.close()
+    if remove_file:
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            if os.path.exists(database.db_name + suffix):
+                os.remove(database.db_name + suffix)
@@ -3,7 +3,7 @@ name = 'ormik'
 __all__ = [
     'FieldError', 'PkCountError',
     'QueryError', 'DbOperationError', 'ModelRegistrationError',
-    'ObjectDoesNotExistError', 'MultipleObjectsError'
+    'ObjectDoesNotExistError', 'MultipleObjectsError', 'PoolTimeoutError'
 ]
 
 
@@ -33,3 +33,7 @@ class DbOperationError(Exception):
 
 class ModelRegistrationError(Exception):
     """  Error with Model registration """
+
+
+class PoolTimeoutError(Exception):
+    """ Connection was not checked out of the pool in time """
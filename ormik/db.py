@@ -1,31 +1,454 @@
+import asyncio
+import logging
 import sqlite3
+import threading
+import time
 
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
 from sqlite3 import OperationalError
+from types import SimpleNamespace
 
-from ormik import ModelRegistrationError
+from ormik import \
+    ModelRegistrationError, DbOperationError, PoolTimeoutError
 from ormik.models import ModelMeta
 from ormik.queryset import QueryManager
 
 
-__all__ = ['SqliteDatabase', 'OperationalError']
+__all__ = [
+    'SqliteDatabase', 'PooledSqliteDatabase', 'IdentityMap',
+    'ExecutedQuery', 'CapturedQueries',
+    'OperationalError', 'PRAGMA_PROFILES'
+]
+
+logger = logging.getLogger('ormik')
+
+
+# PRAGMAs applied once to every new connection.
+# Profiles are selected by name: SqliteDatabase(db, pragmas='performance')
+PRAGMA_PROFILES = {
+    'default': {
+        'foreign_keys': 'ON',
+    },
+    'performance': {
+        'foreign_keys': 'ON',
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,  # 64Mb
+        'mmap_size': 268435456,  # 256Mb
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+
+class IdentityMap:
+    """ Model instances of a unit of work keyed on (model, pk).
+    The same row is represented by the same instance.
+    """
+
+    def __init__(self):
+        self._instances = {}
+
+    def __len__(self):
+        return len(self._instances)
+
+    def __contains__(self, instance):
+        return self._instances.get(self._key(instance)) is instance
+
+    @staticmethod
+    def _key(instance):
+        return instance.__class__, instance.__dict__.get(instance._pk.name)
+
+    def get(self, model, pk):
+        return self._instances.get((model, pk))
+
+    def add(self, instance):
+        """ Add instance unless the row is already mapped.
+        Returns mapped instance.
+        """
+        return self._instances.setdefault(self._key(instance), instance)
+
+    def update(self, instance):
+        """ Add instance or refresh mapped instance of the same row.
+        Returns mapped instance.
+        """
+        mapped = self.add(instance)
+        if mapped is not instance:
+            mapped._refresh_from(instance)
+        return mapped
+
+    def discard(self, model, pk):
+        self._instances.pop((model, pk), None)
+
+    def models(self):
+        return {model for model, _ in self._instances}
+
+    def instances(self, model):
+        return [
+            instance for (
+                instance_model, _
+            ), instance in self._instances.items() if instance_model is model
+        ]
+
+    def clear(self):
+        self._instances.clear()
+
+
+class ExecutedQuery:
+    """ Statement executed by the database, passed to after_execute hooks.
+    duration is in seconds. rowcount is the number of rows modified,
+    it is -1 for SELECT as rows are fetched after execution.
+    """
+
+    __slots__ = ('sql', 'params', 'duration', 'rowcount', 'many')
+
+    def __init__(self, sql, params, duration, rowcount, many=False):
+        self.sql = sql
+        self.params = params
+        self.duration = duration
+        self.rowcount = rowcount
+        self.many = many
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}'
+            f'({self.sql!r}, {self.duration * 1000:.3f}ms)'
+        )
+
+
+class CapturedQueries:
+    """ Queries executed in db.capture_queries() block """
+
+    def __init__(self):
+        self.queries = []
+
+    def __len__(self):
+        return len(self.queries)
+
+    def __iter__(self):
+        return iter(self.queries)
+
+    def __getitem__(self, index):
+        return self.queries[index]
+
+    @property
+    def duration(self):
+        return sum(query.duration for query in self.queries)
+
+    def repeated(self, threshold=2):
+        """ Statements executed at least threshold times: {sql: count}.
+        The same statement repeated with different params
+        is likely an N+1 query pattern.
+        """
+        return {
+            sql: count for sql, count in
+            Counter(query.sql for query in self.queries).items()
+            if count >= threshold
+        }
+
+
+class Atomic:
+    """ Transaction context manager and decorator.
+    The outermost block runs BEGIN ... COMMIT,
+    nested blocks are made with SAVEPOINTs.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.savepoint = None
+
+    def __enter__(self):
+        transactions = self.db._transactions
+        if transactions:
+            self.savepoint = f'ormik_sp{len(transactions)}'
+            self.db.connection.execute(f'SAVEPOINT {self.savepoint}')
+        else:
+            self.db.connection.execute('BEGIN')
+        transactions.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.db._transactions.pop()
+        connection = self.db.connection
+        if self.savepoint is not None:
+            if exc_type is not None:
+                connection.execute(f'ROLLBACK TO SAVEPOINT {self.savepoint}')
+            connection.execute(f'RELEASE SAVEPOINT {self.savepoint}')
+        elif exc_type is not None:
+            connection.execute('ROLLBACK')
+        else:
+            try:
+                connection.execute('COMMIT')
+            except sqlite3.Error:
+                connection.execute('ROLLBACK')
+                raise
+
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.db.atomic():
+                return func(*args, **kwargs)
+        return wrapper
 
 
 class SqliteDatabase:
 
-    def __init__(self, database):
+    # Size of sqlite3 prepared statements cache per connection
+    cached_statements = 256
+    check_same_thread = True
+
+    def __init__(self, database, pragmas='default'):
         self.db_name = database
-        self.connection = self._connect(database)
+        self.pragmas = self._get_pragmas(pragmas)
+        self._local = self._init_local()
+        self._sessions = threading.local()
+        # Hooks are kept in tuples replaced on change,
+        # so that executing threads never see them half-updated
+        self._before_execute_hooks = ()
+        self._after_execute_hooks = ()
+
+    def _get_pragmas(self, pragmas):
+        """ Pragmas may be a profile name or a dict of custom pragmas
+        which are added to the default profile.
+        """
+        if isinstance(pragmas, str):
+            if pragmas not in PRAGMA_PROFILES:
+                raise DbOperationError(
+                    f'Unknown pragmas profile "{pragmas}", '
+                    f'choose one of {list(PRAGMA_PROFILES)}'
+                )
+            return dict(PRAGMA_PROFILES[pragmas])
+        return {**PRAGMA_PROFILES['default'], **dict(pragmas or {})}
+
+    def _init_local(self):
+        # Connection state: the connection and its open atomic() blocks
+        return SimpleNamespace(
+            connection=self._connect(self.db_name),
+            transactions=[]
+        )
 
     def _connect(self, database):
+        # Connection is in autocommit mode:
+        # transactions are managed with atomic()
         conn = sqlite3.connect(
-            database
+            database,
+            cached_statements=self.cached_statements,
+            check_same_thread=self.check_same_thread,
+            isolation_level=None
         )
         conn.row_factory = sqlite3.Row
+        self.init_connection(conn)
         return conn
 
+    def init_connection(self, conn):
+        """ Called once for every new connection """
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+
     def __repr__(self):
         return f'{self.__class__.__name__}({self.db_name})'
 
+    @property
+    def connection(self):
+        return self._local.connection
+
+    @property
+    def _transactions(self):
+        return self._local.transactions
+
+    @contextmanager
+    def connection_context(self):
+        """ Use connection in a block, e.g. per WSGI request """
+        yield self.connection
+
+    def execute(self, cursor, sql, params=(), many=False):
+        """ Execute statement with cursor running execute hooks.
+        Statements are timed only if any hook is registered.
+        """
+        run = cursor.executemany if many else cursor.execute
+        before_hooks = self._before_execute_hooks
+        after_hooks = self._after_execute_hooks
+        if not (before_hooks or after_hooks):
+            run(sql, params)
+            return cursor
+
+        for hook in before_hooks:
+            hook(sql, params)
+        start = time.perf_counter()
+        run(sql, params)
+        duration = time.perf_counter() - start
+        if after_hooks:
+            query = ExecutedQuery(
+                sql, params, duration, cursor.rowcount, many
+            )
+            for hook in after_hooks:
+                hook(query)
+        return cursor
+
+    def before_execute(self, hook):
+        """ Register hook(sql, params) called before each statement.
+        May be used as a decorator.
+        """
+        self._before_execute_hooks += (hook, )
+        return hook
+
+    def after_execute(self, hook):
+        """ Register hook(query) called with ExecutedQuery
+        after each statement. May be used as a decorator.
+        """
+        self._after_execute_hooks += (hook, )
+        return hook
+
+    def remove_hook(self, hook):
+        self._before_execute_hooks = tuple(
+            h for h in self._before_execute_hooks if h is not hook
+        )
+        self._after_execute_hooks = tuple(
+            h for h in self._after_execute_hooks if h is not hook
+        )
+
+    @contextmanager
+    def capture_queries(self, n_plus_one_threshold=None):
+        """ Capture queries executed in a block.
+        If n_plus_one_threshold is set, statements repeated
+        at least that many times are logged as possible N+1 queries.
+        Example:
+            with db.capture_queries() as captured:
+                Book.select_all()
+            assert len(captured) == 1
+        """
+        captured = CapturedQueries()
+        outer_captures = self._current_captures
+        # Captures are per thread: statements of other threads
+        # are not captured, async queries run in the block are
+        self._sessions.captures = outer_captures + (captured, )
+
+        def capture(query):
+            if captured in self._current_captures:
+                captured.queries.append(query)
+
+        hook = self.after_execute(capture)
+        try:
+            yield captured
+        finally:
+            self.remove_hook(hook)
+            self._sessions.captures = outer_captures
+        if n_plus_one_threshold is not None:
+            for sql, count in captured.repeated(n_plus_one_threshold).items():
+                logger.warning(
+                    'Possible N+1 queries: executed %d times: %s', count, sql
+                )
+
+    def log_slow_queries(self, threshold=0.1, explain=True):
+        """ Log statements executed longer than threshold seconds
+        with their EXPLAIN QUERY PLAN. Returns the hook to remove it with
+        remove_hook().
+        """
+        def log_slow_query(query):
+            if query.duration < threshold:
+                return
+            plan = ''
+            if explain and not query.many:
+                plan = '\n'.join(self._explain(query.sql, query.params))
+            logger.warning(
+                'Slow query (%.3fs): %s %r\n%s',
+                query.duration, query.sql, query.params, plan
+            )
+
+        return self.after_execute(log_slow_query)
+
+    def _explain(self, sql, params=()):
+        """ EXPLAIN QUERY PLAN details of statement """
+        try:
+            rows = self.connection.execute(
+                f'EXPLAIN QUERY PLAN {sql}', params
+            ).fetchall()
+        except sqlite3.Error:
+            return []
+        return [row['detail'] for row in rows]
+
+    @property
+    def current_identity_map(self):
+        return getattr(self._sessions, 'identity_map', None)
+
+    @contextmanager
+    def identity_map(self):
+        """ Unit of work where each row is fetched once
+        and represented by the same model instance.
+        Identity map is per thread, nested blocks share the outer map.
+        Example:
+            with db.identity_map():
+                assert Author.get(id=1) is Author.get(id=1)
+        """
+        identity_map = self.current_identity_map
+        if identity_map is not None:
+            yield identity_map
+            return
+
+        identity_map = self._sessions.identity_map = IdentityMap()
+        try:
+            yield identity_map
+        finally:
+            self._sessions.identity_map = None
+
+    @property
+    def _current_captures(self):
+        return getattr(self._sessions, 'captures', ())
+
+    def _run_in_session(
+            self, identity_map, captures, func, *args, **kwargs
+    ):
+        self._sessions.identity_map = identity_map
+        self._sessions.captures = captures
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._sessions.identity_map = None
+            self._sessions.captures = ()
+
+    @property
+    def executor(self):
+        raise DbOperationError(
+            f'{self} connection can not be used by executor threads, '
+            f'use PooledSqliteDatabase for async queries'
+        )
+
+    async def run_async(self, func, *args, **kwargs):
+        """ Run blocking db function with db executor.
+        Identity map and query captures of the calling thread
+        are used by the executor worker.
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(
+                self._run_in_session,
+                self.current_identity_map, self._current_captures,
+                func, *args, **kwargs
+            )
+        )
+
+    def close(self):
+        self.connection.close()
+
+    @property
+    def in_transaction(self):
+        return bool(self._transactions)
+
+    def atomic(self):
+        """ Run queries in a transaction. Blocks may be nested.
+        Example:
+            with db.atomic():
+                Author.create(name='William Gibson')
+
+            @db.atomic()
+            def create_author(name):
+                return Author.create(name=name)
+        """
+        return Atomic(self)
+
     def register_models(self, models_to_register=None):
         if models_to_register is None:
             models_to_register = []
@@ -38,4 +461,163 @@ class SqliteDatabase:
                     f'Please pass list of models to {self}.'
                     f'{model} is not a Model'
                 )
-            model.query_manager = QueryManager(self, model)
+            QueryManager(self, model).bind_to_model()
+
+
+class PooledSqliteDatabase(SqliteDatabase):
+    """ SqliteDatabase with a connection per thread.
+    Connections are checked out of a bounded pool on first use in a thread
+    and returned to it with release() or at the end of connection_context().
+    Returned connections are reused with their statement caches.
+    Async queries are run with executor of async_workers threads,
+    each worker keeps its own connection, so at least one connection
+    is left to other threads: async_workers < max_connections.
+    """
+
+    check_same_thread = False
+
+    def __init__(
+        self, database, max_connections=8, timeout=10, async_workers=None,
+        pragmas='default'
+    ):
+        if async_workers is None:
+            async_workers = max_connections - 1
+        elif async_workers >= max_connections:
+            raise DbOperationError(
+                f'async_workers ({async_workers}) should be less than '
+                f'max_connections ({max_connections}): workers keep '
+                f'their connections'
+            )
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.async_workers = async_workers
+        self._executor = None
+        self._idle = []
+        self._in_use = {}
+        self._connections_count = 0
+        self._closed = False
+        self._pool_lock = threading.Condition()
+        super().__init__(database, pragmas=pragmas)
+
+    def _init_local(self):
+        return threading.local()
+
+    @property
+    def connection(self):
+        local = self._local
+        try:
+            return local.connection
+        except AttributeError:
+            local.connection = self._checkout()
+            local.transactions = []
+            return local.connection
+
+    @property
+    def _transactions(self):
+        self.connection
+        return self._local.transactions
+
+    @property
+    def connections_count(self):
+        return self._connections_count
+
+    @property
+    def idle_count(self):
+        return len(self._idle)
+
+    @property
+    def executor(self):
+        if self.async_workers < 1:
+            raise DbOperationError(
+                f'{self} has no async workers, '
+                f'increase max_connections or async_workers'
+            )
+        with self._pool_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.async_workers,
+                    thread_name_prefix='ormik'
+                )
+        return self._executor
+
+    def _checkout(self):
+        deadline = None if self.timeout is None else \
+            time.monotonic() + self.timeout
+        with self._pool_lock:
+            while True:
+                if self._closed:
+                    raise DbOperationError(f'{self} is closed')
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._connections_count < self.max_connections:
+                    conn = self._connect(self.db_name)
+                    self._connections_count += 1
+                    break
+                if self._reclaim_dead_threads_connections():
+                    continue
+
+                remaining = None if deadline is None else \
+                    deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolTimeoutError(
+                        f'{self}: all {self.max_connections} connections '
+                        f'are in use'
+                    )
+                self._pool_lock.wait(remaining)
+
+            self._in_use[threading.current_thread()] = conn
+        return conn
+
+    def _reclaim_dead_threads_connections(self):
+        dead_threads = [
+            thread for thread in self._in_use if not thread.is_alive()
+        ]
+        for thread in dead_threads:
+            self._put_back(self._in_use.pop(thread))
+        return bool(dead_threads)
+
+    def _put_back(self, conn):
+        if self._closed:
+            conn.close()
+            self._connections_count -= 1
+            return
+
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        self._idle.append(conn)
+
+    def release(self):
+        """ Return connection of the current thread to the pool """
+        conn = self._local.__dict__.pop('connection', None)
+        if conn is None:
+            return
+
+        self._local.transactions = []
+        with self._pool_lock:
+            self._in_use.pop(threading.current_thread(), None)
+            self._put_back(conn)
+            self._pool_lock.notify()
+
+    @contextmanager
+    def connection_context(self):
+        try:
+            yield self.connection
+        finally:
+            self.release()
+
+    def close(self):
+        """ Close idle connections.
+        Connections in use are closed when they are released.
+        """
+        if self._executor is not None:
+            # Executor workers keep their connections till they exit
+            self._executor.shutdown(wait=True)
+        with self._pool_lock:
+            self._reclaim_dead_threads_connections()
+            self._closed = True
+            for conn in self._idle:
+                conn.close()
+            self._connections_count -= len(self._idle)
+            self._idle = []
+            self._pool_lock.notify_all()
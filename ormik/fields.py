@@ -13,12 +13,15 @@ class Field:
     def __init__(
         self,
         name=None, is_nullable=True, default=None, primary_key=False,
+        index=False, unique=False,
         **kwargs
     ):
         self.name = name
         self.is_nullable = is_nullable
         self.default_value = default
         self.is_primary_key = primary_key
+        self.index = index
+        self.unique = unique
         self.query = FieldSQL(self)
 
     def __set__(self, instance, value):
@@ -66,16 +69,42 @@ class ForeignKeyField(Field):
 
     def __init__(
         self, model, reverse_name, *args,
-        on_delete=NO_ACTION, on_update=NO_ACTION,
+        on_delete=NO_ACTION, on_update=NO_ACTION, lazy=False,
         **kwargs
     ):
+        # FK columns are indexed by default:
+        # they are used in joins and reverse relation lookups
+        kwargs.setdefault('index', True)
         super().__init__(*args, **kwargs)
         self.rel_model = model
         self.reverse_name = reverse_name
         self.on_delete = on_delete
         self.on_update = on_update
+        self.lazy = lazy
+
+    @property
+    def id_name(self):
+        return f'{self.name}_id'
+
+    def __get__(self, instance, instance_type=None):
+        if instance is None:
+            return self
+
+        value = instance.__dict__.get(self.name)
+        if value is not None and not isinstance(value, self.rel_model):
+            # Lazy FK stores related model pk.
+            # Fetch related model on first access and cache it.
+            value = self.rel_model.get(**{
+                self.rel_model._pk.name: value
+            })
+            instance.__dict__[self.name] = value
+        return value
 
     def __set__(self, instance, value=None):
+        if self.lazy:
+            self._set_lazy(instance, value)
+            return
+
         if value in (NULL, None): value = self.rel_model()
         if isinstance(value, int):
             # Model instance pk was passed
@@ -86,6 +115,36 @@ class ForeignKeyField(Field):
             raise FieldError(instance, self.name, self.rel_model, value)
         super().__set__(instance, value)
 
+    def _set_lazy(self, instance, value):
+        # Store related model pk without fetching it
+        if value is NULL: value = None
+        if not (
+            value is None or isinstance(value, (int, self.rel_model))
+        ):
+            raise FieldError(instance, self.name, self.rel_model, value)
+        super().__set__(instance, value)
+
+
+class ForeignKeyIdAccessor:
+    """ Raw FK value accessor, e.g. book.author_id.
+    Returns related model pk and never makes a query.
+    """
+
+    def __init__(self, fk_field):
+        self.fk_field = fk_field
+
+    def __get__(self, instance, instance_type=None):
+        if instance is None:
+            return self
+
+        value = instance.__dict__.get(self.fk_field.name)
+        if isinstance(value, self.fk_field.rel_model):
+            value = getattr(value, value._pk.name)
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.fk_field.name] = value
+
 
 class ReversedForeignKeyField(Field):
 
@@ -95,11 +154,29 @@ class ReversedForeignKeyField(Field):
         self.field_name = field_name
 
     def __get__(self, instance, instance_type=None):
-        if instance is not None:
-            return self.origin_model.filter(**{
-                self.field_name: getattr(instance, self.origin_model._pk.name)
-            })
-        return self
+        if instance is None:
+            return self
+
+        prefetched = getattr(instance, '_prefetched', None) or {}
+        qs = prefetched.get(self)
+        if isinstance(qs, list):
+            # Serve prefetched instances from QuerySet result cache
+            prefetched[self] = qs = self._filter(instance)._set_result(qs)
+        return qs if qs is not None else self._filter(instance)
+
+    def _filter(self, instance):
+        return self.origin_model.filter(**{
+            self.field_name: getattr(instance, instance._pk.name)
+        })
+
+    def set_prefetched(self, instance, origin_instances):
+        """ Cache instances of reverse relation selected with
+        prefetch_related()
+        """
+        prefetched = getattr(instance, '_prefetched', None)
+        if prefetched is None:
+            prefetched = instance._prefetched = {}
+        prefetched[self] = origin_instances
 
 
 class CharField(TypedField, SizedField):
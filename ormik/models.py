@@ -1,8 +1,156 @@
-from ormik import PkCountError, ModelRegistrationError, fields
+from collections.abc import MutableMapping
+
+from ormik import FieldError, PkCountError, ModelRegistrationError, fields
+from ormik.sql import Index
 
 __all__ = ['Model']
 
 
+def _slot_name(field_name):
+    return f'_field_{field_name}'
+
+
+class CompactFieldValues(MutableMapping):
+    """ __dict__ of compact model instance.
+    Field values are stored in instance slots.
+    """
+
+    __slots__ = ('instance', )
+
+    def __init__(self, instance):
+        self.instance = instance
+
+    def __getitem__(self, field_name):
+        try:
+            return getattr(self.instance, _slot_name(field_name))
+        except AttributeError:
+            raise KeyError(field_name)
+
+    def __setitem__(self, field_name, value):
+        try:
+            setattr(self.instance, _slot_name(field_name), value)
+        except AttributeError:
+            raise KeyError(field_name)
+
+    def __delitem__(self, field_name):
+        try:
+            delattr(self.instance, _slot_name(field_name))
+        except AttributeError:
+            raise KeyError(field_name)
+
+    def __iter__(self):
+        for field_name in self.instance._fields:
+            if hasattr(self.instance, _slot_name(field_name)):
+                yield field_name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def _column_value(value):
+    """ Value of field as stored in its column: FK model instance pk """
+    if isinstance(value, Model):
+        return value.__dict__.get(value._pk.name)
+    return value
+
+
+def _get_compact_values(instance):
+    return CompactFieldValues(instance)
+
+
+def _set_compact_values(instance, values):
+    values = dict(values)
+    compact_values = CompactFieldValues(instance)
+    compact_values.clear()
+    compact_values.update(values)
+
+
+class CompactField:
+    """ Descriptor of compact model field reading its slot.
+    Values are validated with the model field on set.
+    """
+
+    __slots__ = ('field', 'slot')
+
+    def __init__(self, field, slot):
+        self.field, self.slot = field, slot
+
+    def __get__(self, instance, instance_type=None):
+        if instance is None:
+            return self.field
+        try:
+            return self.slot.__get__(instance, instance_type)
+        except AttributeError:
+            return None
+
+    def __set__(self, instance, value):
+        self.field.__set__(instance, value)
+
+
+def _add_compact_slots(clsdict, bases):
+    """ Declare __slots__ for fields not having slots in bases """
+    clsdict['__compact__'] = True
+    clsdict['__slots__'] = tuple(
+        _slot_name(attr_name) for attr_name, attr in clsdict.items()
+        if isinstance(attr, fields.Field) and not any(
+            _slot_name(attr_name) in mro_class.__dict__
+            for base_class in bases
+            for mro_class in base_class.__mro__
+        )
+    )
+    clsdict['__dict__'] = property(_get_compact_values, _set_compact_values)
+
+
+def _bind_compact_fields(model_cls):
+    """ Serve compact model fields from their slots """
+    for field_name, field in model_cls._fields.items():
+        slot = getattr(model_cls, _slot_name(field_name))
+        if not isinstance(field, fields.ForeignKeyField):
+            # FK field reads __dict__ itself
+            setattr(model_cls, field_name, CompactField(field, slot))
+    model_cls._slot_setters = tuple(
+        getattr(model_cls, _slot_name(field_name)).__set__
+        for field_name in model_cls._columns
+    )
+
+
+def _bind_fk_accessors(model_cls, fk_field):
+    """ Create reverse_attr for FK model
+    and raw FK value accessor, e.g. "author_id"
+    """
+    if fk_field.id_name not in model_cls._fields:
+        setattr(
+            model_cls, fk_field.id_name, fields.ForeignKeyIdAccessor(fk_field)
+        )
+    setattr(
+        fk_field.rel_model,
+        fk_field.reverse_name,
+        fields.ReversedForeignKeyField(model_cls, fk_field.name)
+    )
+
+
+def _model_indexes(model_cls, clsdict):
+    """ Indexes of fields with index=True or unique=True
+    followed by indexes declared with __indexes__
+    """
+    indexes = [
+        Index(field_name, unique=field.unique)
+        for field_name, field in model_cls._fields.items()
+        if (field.index or field.unique) and not field.is_primary_key
+    ]
+    for index in clsdict.get('__indexes__', ()):
+        if not isinstance(index, Index):
+            index = Index(*index)
+        for field_name in index.field_names:
+            if field_name not in model_cls._fields:
+                raise FieldError(
+                    f'Index field "{field_name}" is not a field '
+                    f'of {model_cls.__name__}'
+                )
+        indexes.append(index)
+    return tuple(indexes)
+
+
 class ModelMeta(type):
 
     def __new__(mtcls, name, bases, clsdict):
@@ -13,6 +161,15 @@ class ModelMeta(type):
             for field_name, field in base_class._fields.items():
                 clsdict[field_name] = field
 
+        # Compact model stores fields values in __slots__
+        # instead of per-instance __dict__
+        is_compact = clsdict.get('__compact__', False) or any(
+            getattr(base_class, '__compact__', False)
+            for base_class in bases
+        )
+        if is_compact:
+            _add_compact_slots(clsdict, bases)
+
         # Create model_cls
         model_cls = super().__new__(mtcls, name, bases, clsdict)
         model_cls._fields = {
@@ -22,6 +179,14 @@ class ModelMeta(type):
         }
         model_cls._table = clsdict.get('__tablename__', name.lower())
         model_cls._pk = None
+        # Columns order of selected rows
+        model_cls._columns = tuple(model_cls._fields)
+        model_cls._pk_index = None
+        model_cls._indexes = _model_indexes(model_cls, clsdict)
+        model_cls._eager_fks = tuple(
+            field_name for field_name, field in model_cls._fields.items()
+            if isinstance(field, fields.ForeignKeyField) and not field.lazy
+        )
 
         pk_count = 0
         for model_field_name, model_field in model_cls._fields.items():
@@ -35,31 +200,28 @@ class ModelMeta(type):
                     )
 
                 model_cls._pk = model_field
+                model_cls._pk_index = model_cls._columns.index(
+                    model_field_name
+                )
                 pk_count += 1
 
-            # Create reverse_attr for FK model
             if isinstance(model_field, fields.ForeignKeyField):
-                setattr(
-                    model_field.rel_model,
-                    model_field.reverse_name,
-                    fields.ReversedForeignKeyField(model_cls, model_field.name)
-                )
+                _bind_fk_accessors(model_cls, model_field)
 
-        return model_cls
+        if is_compact:
+            _bind_compact_fields(model_cls)
 
-    def __getattr__(cls, attr):
-        """ Make query upon Model class.
-        Example: Model.create_table()
-        """
-        qs = cls.query_manager.get_queryset()
-        if hasattr(qs, attr):
-            def wrapper(*args, **kwargs):
-                return getattr(qs, attr)(*args, **kwargs)
-            return wrapper
-        raise AttributeError(attr)
+        return model_cls
 
 
 class Model(metaclass=ModelMeta):
+    # Subclasses get __dict__ unless they are compact: __compact__ = True.
+    # Reverse relations selected with prefetch_related() and the snapshot
+    # of column values saved in db are kept apart from fields values
+    __slots__ = ('_prefetched', '_snapshot')
+    __compact__ = False
+    # Set with query methods by db.register_models()
+    query_manager = None
 
     def __init__(self, *args, **kwargs):
         if self._pk is None and self.__class__ is not Model:
@@ -80,10 +242,33 @@ class Model(metaclass=ModelMeta):
             field_value = kwargs.get(field_name, field.default_value)
             setattr(self, field_name, field_value)
 
+    @classmethod
+    def _from_row(cls, row, related=None):
+        """ Make instance from a row selected from model table.
+        Values are trusted and put to instance __dict__ directly
+        bypassing fields validation.
+        Eager FK fields fetch related instances unless they are passed
+        in related dict.
+        The row is kept as snapshot to find changed fields on save().
+        """
+        instance = cls.__new__(cls)
+        instance._snapshot = row
+        if cls.__compact__:
+            for set_slot, value in zip(cls._slot_setters, row):
+                set_slot(instance, value)
+        else:
+            instance.__dict__ = dict(zip(cls._columns, row))
+        if related:
+            instance.__dict__.update(related)
+        for fk in cls._eager_fks:
+            if not (related and fk in related):
+                setattr(instance, fk, instance.__dict__[fk])
+        return instance
+
     def __repr__(self):
         fields_repr = ', '.join(
             [
-                f'{field_name}={getattr(self, field_name)}'
+                f'{field_name}={self.__dict__.get(field_name)}'
                 for field_name in self.fields.keys()
             ]
         )
@@ -95,6 +280,64 @@ class Model(metaclass=ModelMeta):
     def fields(self):
         return self.__class__._fields
 
-    def save(self, *args, **kwargs):
-        saved_inst = self.__class__._save(self, *args, **kwargs)
-        self.__dict__ = saved_inst.__dict__
+    def _changed_fields(self):
+        """ Names of fields changed since the row was selected or saved,
+        all fields if instance has no snapshot
+        """
+        snapshot = getattr(self, '_snapshot', None)
+        if snapshot is None:
+            return list(self._columns)
+        values = self.__dict__
+        return [
+            field_name for field_name, saved_value in zip(
+                self._columns, snapshot
+            ) if _column_value(values.get(field_name)) != saved_value
+        ]
+
+    def _take_snapshot(self, field_names=None):
+        """ Remember column values as saved in db.
+        Only values of field_names are changed in existing snapshot.
+        """
+        values = self.__dict__
+        snapshot = getattr(self, '_snapshot', None)
+        if field_names is None:
+            self._snapshot = tuple(
+                _column_value(values.get(field_name))
+                for field_name in self._columns
+            )
+        elif snapshot is not None:
+            snapshot = list(snapshot)
+            for field_name in field_names:
+                snapshot[self._columns.index(field_name)] = _column_value(
+                    values.get(field_name)
+                )
+            self._snapshot = tuple(snapshot)
+
+    def _refresh_from(self, instance, field_names=None):
+        """ Take field values and snapshot of instance of the same row,
+        only of field_names if passed
+        """
+        if field_names is None:
+            self.__dict__.update(instance.__dict__)
+            self._snapshot = getattr(instance, '_snapshot', None)
+            return
+
+        values = instance.__dict__
+        for field_name in field_names:
+            self.__dict__[field_name] = values[field_name]
+        self._take_snapshot(field_names)
+
+    def save(self, refresh=True):
+        """ Insert or update instance row.
+        Only changed fields are updated, nothing is done if there are none.
+        Values are read back from db unless refresh=False.
+        """
+        saved_inst = self.query_manager.get_queryset()._save(self, refresh)
+        if saved_inst is not self:
+            self._refresh_from(saved_inst)
+        identity_map = self.query_manager.db.current_identity_map
+        if identity_map is not None:
+            identity_map.update(self)
+
+    async def asave(self, *args, **kwargs):
+        await self.query_manager.db.run_async(self.save, *args, **kwargs)
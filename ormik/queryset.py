@@ -1,27 +1,159 @@
+import asyncio
+import threading
+
+from array import array
+from collections import namedtuple
 from functools import wraps
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 from ormik import \
-    DbOperationError, ObjectDoesNotExistError, MultipleObjectsError
+    DbOperationError, ObjectDoesNotExistError, MultipleObjectsError, \
+    QueryError
+from ormik import fields
 from ormik.db import OperationalError
-from ormik.sql import QuerySQL
+from ormik.sql import CASCADE, SET_NULL, Count, QuerySQL
 from ormik.models import Model
 
 __all__ = ['QuerySet', 'QueryManager']
 
 
+PREFETCH_BATCH_SIZE = 500
+ITERATOR_CHUNK_SIZE = 2000
+
+# Marks the end of aiter() chunks queue
+_END_OF_CHUNKS = object()
+
+# QuerySet methods bound to QueryManager and registered model classes
+MANAGER_METHODS = (
+    'filter', 'select_related', 'prefetch_related', 'order_by',
+    'get', 'get_or_create', 'create', 'update', 'delete',
+    'bulk_create', 'bulk_update', 'select_all', 'iterator', 'aiter',
+    'values', 'values_list', 'values_columns', 'values_iterator',
+    'count', 'exists', 'aggregate', 'annotate',
+    'first', 'last', 'paginate_after', 'create_table', 'drop_table',
+    'aget', 'aget_or_create', 'acreate', 'aupdate', 'adelete',
+    'aselect_all', 'avalues', 'acount', 'aexists', 'aaggregate',
+    'afirst', 'alast', 'apaginate_after', 'aannotate', 'avalues_list',
+    'avalues_columns', 'abulk_create', 'abulk_update',
+    'acreate_table', 'adrop_table',
+)
+
+
 def clear_lookup_statements(cls_method):
     @wraps(cls_method)
     def wrapper(qs, *args, **kwargs):
         # Prevent passing Model instance in lookup statements
         # For example update(fk_field=fk_instance)
         for k, v in kwargs.items():
-            if isinstance(v, Model):
-                kwargs[k] = getattr(v, v._pk.name)
+            kwargs[k] = _db_value(v)
         return cls_method(qs, *args, **kwargs)
     return wrapper
 
 
+def run_on_clone(qs_method):
+    """ Run method with a clone of QuerySet,
+    so that building its query does not change the QuerySet
+    """
+    @wraps(qs_method)
+    def wrapper(qs, *args, **kwargs):
+        return qs_method(qs._clone(), *args, **kwargs)
+    return wrapper
+
+
+def _async_method(method_name):
+    async def wrapper(qs, *args, **kwargs):
+        return await qs.db.run_async(
+            getattr(qs, method_name), *args, **kwargs
+        )
+    wrapper.__name__ = f'a{method_name}'
+    wrapper.__doc__ = f'Async {method_name}() run with db executor'
+    return wrapper
+
+
+def _make_instance(model, row, identity_map=None, related=None):
+    if identity_map is None:
+        return model._from_row(row, related)
+
+    instance = identity_map.get(model, row[model._pk_index])
+    if instance is None:
+        instance = identity_map.add(model._from_row(row, related))
+    return instance
+
+
+def _db_value(value):
+    if isinstance(value, Model):
+        return getattr(value, value._pk.name)
+    return value
+
+
+def _split_by_pk(instances, pk_name):
+    """ Instances with pk set and without it """
+    with_pk, without_pk = [], []
+    for inst in instances:
+        if inst.__dict__.get(pk_name) is None:
+            without_pk.append(inst)
+        else:
+            with_pk.append(inst)
+    return with_pk, without_pk
+
+
+def _check_batch_size(batch_size):
+    if batch_size is not None and batch_size < 1:
+        raise QueryError(f'batch_size should be >= 1, not {batch_size}')
+
+
+def _changed_on_delete(fk, model):
+    """ Whether deleting rows of model deletes or changes FK rows """
+    if not isinstance(fk, fields.ForeignKeyField):
+        return False
+    return fk.rel_model is model and fk.on_delete in (CASCADE, SET_NULL)
+
+
+def _related_instances(values):
+    """ FK model instances of field values, reused by Model._from_row() """
+    return {
+        field_name: value for field_name, value in values.items()
+        if isinstance(value, Model)
+    }
+
+
+def _fetch_chunks(cursor, chunk_size):
+    rows = cursor.fetchmany(chunk_size)
+    while rows:
+        yield rows
+        rows = cursor.fetchmany(chunk_size)
+
+
+def _array_typecode(field):
+    """ array.array typecode for column values of field or None """
+    if isinstance(field, fields.ForeignKeyField):
+        field = field.rel_model._pk
+    if isinstance(field, fields.BooleanField):
+        return 'b'
+    if isinstance(field, fields.IntegerField):
+        return 'q'
+    return None
+
+
+def _batches(items, batch_size=None):
+    batch_size = batch_size or len(items) or 1
+    for i in range(0, len(items), batch_size):
+        yield items[i:i + batch_size]
+
+
 class QuerySet():
+    """ Lazy query of model instances.
+    Chaining methods (filter(), order_by(), slicing, ...) return
+    a new QuerySet, so a base QuerySet may be reused.
+    Iteration, len() and bool() fetch rows once and cache instances.
+    """
+
+    # Set on the base QuerySet of QueryManager, whose query is never built
+    _is_base = False
 
     def __init__(self, query_manager, *args, **kwargs):
         self.query = QuerySQL(query_manager.model)
@@ -29,62 +161,669 @@ class QuerySet():
         self.model = query_manager.model
         self.db = query_manager.db
         self.querystring = None
+        self.queryparams = ()
+        self.prefetch_fields = []
+        self.use_identity_map = True
+        self._result_cache = None
 
     def __repr__(self):
         return f'{self.__class__.__name__}({self.model.__name__})'
 
     def __iter__(self):
-        return iter(self.select_all())
+        return iter(self._fetch_all())
+
+    def __len__(self):
+        return len(self._fetch_all())
+
+    def __bool__(self):
+        return bool(self._fetch_all())
+
+    def __getitem__(self, key):
+        """ Slice with LIMIT/OFFSET: Book.order_by('title')[100:200]
+        Index returns model instance: Book.order_by('title')[100]
+        Fetched QuerySet is sliced in memory.
+        """
+        if isinstance(key, slice):
+            if key.step is not None:
+                raise QueryError('QuerySet slicing with step is not supported')
+        elif not isinstance(key, int):
+            raise TypeError(
+                f'QuerySet indices must be integers or slices, '
+                f'not {type(key).__name__}'
+            )
+        if self._result_cache is not None:
+            return self._result_cache[key]
+
+        qs = self._clone()
+        if isinstance(key, slice):
+            qs._slice(key.start or 0, key.stop)
+            return qs
+
+        qs._slice(key, key + 1)
+        instances = qs.select_all()
+        if not instances:
+            raise IndexError('QuerySet index out of range')
+        return instances[0]
+
+    def _clone(self):
+        qs = self.__class__.__new__(self.__class__)
+        qs.__dict__.update(self.__dict__)
+        if self._is_base:
+            # Empty query of the base QuerySet: a new one is cheaper to make
+            qs.query = QuerySQL(self.model)
+            qs.prefetch_fields = []
+            qs._is_base = False
+        else:
+            qs.query = self.query.clone()
+            qs.prefetch_fields = list(self.prefetch_fields)
+        qs.querystring, qs.queryparams = None, ()
+        qs._result_cache = None
+
+        return qs
+
+    def _set_result(self, instances):
+        """ Fill result cache with instances selected elsewhere """
+        self._result_cache = instances
+
+        return self
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = self.select_all()
+
+        return self._result_cache
+
+    def _slice(self, start, stop=None):
+        """ Narrow LIMIT/OFFSET of the query by slice of its rows """
+        if start < 0 or (stop is not None and stop < 0):
+            raise QueryError('Negative indexing is not supported')
+        query = self.query
+        limit = query.limit
+        if limit is not None:
+            limit = max(limit - start, 0)
+        if stop is not None:
+            limit = max(stop - start, 0) if limit is None else \
+                min(limit, max(stop - start, 0))
+        query.limit = limit
+        query.offset = (query.offset or 0) + start or None
+
+    @property
+    def is_sliced(self):
+        return self.query.limit is not None or self.query.offset is not None
 
-    def _save(self, model_instance):
-        inst_dict = model_instance.__dict__
-        inst_id = inst_dict.pop('id')
+    def _check_not_sliced(self, action):
+        if self.is_sliced:
+            raise QueryError(f'Can not {action} a sliced QuerySet')
+
+    def _hydrate(self, rows, rows_related=None):
+        """ Make model instances from selected rows with Model._from_row().
+        Rows contain model columns followed by columns of FK models
+        selected with select_related().
+        FK instances selected with select_related() or prefetch_related()
+        are passed to the model so FK field does not fetch them one by one.
+        Reverse relations passed to prefetch_related() are cached
+        on the instances.
+        """
+        model = self.model
+        rows_related = rows_related or [{} for _ in rows]
+
+        rel_offset = len(model._columns)
+        for fk in self.query.related_fields:
+            rel_model = model._fields[fk].rel_model
+            rel_columns_count = len(rel_model._columns)
+            rel_pk_index = rel_offset + rel_model._pk_index
+            rel_identity_map = self._identity_map(rel_model)
+            rel_instances = {}
+            for row, row_related in zip(rows, rows_related):
+                rel_pk = row[rel_pk_index]
+                if rel_pk is None:
+                    continue
+                if rel_pk not in rel_instances:
+                    rel_instances[rel_pk] = _make_instance(
+                        rel_model,
+                        row[rel_offset:rel_offset + rel_columns_count],
+                        rel_identity_map
+                    )
+                row_related[fk] = rel_instances[rel_pk]
+            rel_offset += rel_columns_count
+
+        reverse_names = []
+        for fk in self.prefetch_fields:
+            if fk not in model._fields:
+                reverse_names.append(fk)
+                continue
+            fk_index = model._columns.index(fk)
+            rel_instances = self._prefetch(
+                model._fields[fk].rel_model,
+                {row[fk_index] for row in rows} - {None}
+            )
+            for row, row_related in zip(rows, rows_related):
+                rel_instance = rel_instances.get(row[fk_index])
+                if rel_instance is not None:
+                    row_related[fk] = rel_instance
+
+        identity_map = self._identity_map()
+        instances = [
+            _make_instance(model, row, identity_map, row_related)
+            for row, row_related in zip(rows, rows_related)
+        ]
+        for reverse_name in reverse_names:
+            self._prefetch_reverse(instances, reverse_name)
+
+        return instances
+
+    def _prefetch(self, rel_model, rel_pks):
+        """ Select rel_model instances by pks with "pk IN (...)" queries """
+        rel_pk_name = rel_model._pk.name
+        rel_instances = {}
+        rel_identity_map = self._identity_map(rel_model)
+        if rel_identity_map is not None:
+            # Do not fetch instances mapped already
+            for rel_pk in rel_pks:
+                rel_instance = rel_identity_map.get(rel_model, rel_pk)
+                if rel_instance is not None:
+                    rel_instances[rel_pk] = rel_instance
+        rel_pks = [
+            rel_pk for rel_pk in rel_pks if rel_pk not in rel_instances
+        ]
+        for batch in _batches(rel_pks, PREFETCH_BATCH_SIZE):
+            for rel_instance in rel_model.filter(**{
+                f'{rel_pk_name}__in': batch
+            }).select_all():
+                rel_instances[
+                    rel_instance.__dict__[rel_pk_name]
+                ] = rel_instance
+
+        return rel_instances
+
+    def _prefetch_reverse(self, instances, reverse_name):
+        """ Select instances of reverse relation with "fk IN (...)" queries
+        and cache them on instances
+        """
+        reverse_field = getattr(self.model, reverse_name)
+        origin_model = reverse_field.origin_model
+        fk = reverse_field.field_name
+        fk_index = origin_model._columns.index(fk)
+        pk_name = self.model_pk_name
+        instances_by_pk = {
+            instance.__dict__[pk_name]: instance for instance in instances
+        }
+        origin_instances = {pk: [] for pk in instances_by_pk}
+
+        qs = origin_model.query_manager.get_queryset().order_by(
+            origin_model._pk.name
+        )
+        qs.use_identity_map = self.use_identity_map
+        # Prevent other eager FKs from fetching their models one by one
+        qs.prefetch_fields = [
+            eager_fk for eager_fk in origin_model._eager_fks
+            if eager_fk != fk
+        ]
+        for batch in _batches(list(instances_by_pk), PREFETCH_BATCH_SIZE):
+            batch_qs = qs.filter(**{f'{fk}__in': batch})
+            batch_qs.query.append_statement('SELECT')
+            rows = batch_qs._execute_select().fetchall()
+            for row, origin_instance in zip(rows, batch_qs._hydrate(rows, [
+                {fk: instances_by_pk[row[fk_index]]} for row in rows
+            ])):
+                origin_instances[row[fk_index]].append(origin_instance)
+
+        for pk, instance in instances_by_pk.items():
+            reverse_field.set_prefetched(instance, origin_instances[pk])
+
+    def _execute_select(self):
+        cursor = self._execute('select_stmt')
+        # Rows are hydrated by column index:
+        # plain tuples are cheaper than sqlite3.Row
+        cursor.row_factory = None
+
+        return cursor
+
+    def _identity_map(self, model=None):
+        if not self.use_identity_map:
+            return None
+        model = model or self.model
+        return model.query_manager.db.current_identity_map
+
+    def _no_identity_map(self):
+        """ Select fresh instances ignoring identity map """
+        qs = self._clone()
+        qs.use_identity_map = False
+
+        return qs
+
+    def _refresh_updated(self, identity_map, pks, field_names):
+        """ Re-select updated fields of mapped instances of updated rows.
+        Other fields keep values which are not saved yet.
+        """
+        instances = [
+            instance for instance in (
+                identity_map.get(self.model, pk) for pk in pks
+            ) if instance is not None
+        ]
+        if instances:
+            self.model.query_manager.get_queryset()._refresh(
+                instances, PREFETCH_BATCH_SIZE, field_names
+            )
+
+    @staticmethod
+    def _discard_deleted(identity_map, model, pks):
+        """ Discard mapped instances of deleted rows
+        and of their children deleted CASCADE,
+        re-select FKs of children SET NULL
+        """
+        pks = set(pks)
+        for pk in pks:
+            identity_map.discard(model, pk)
+        for child_model in identity_map.models():
+            for fk in child_model._fields.values():
+                if not _changed_on_delete(fk, model):
+                    continue
+                children = [
+                    instance for instance in identity_map.instances(
+                        child_model
+                    ) if _db_value(instance.__dict__.get(fk.name)) in pks
+                ]
+                if not children:
+                    continue
+                if fk.on_delete == CASCADE:
+                    QuerySet._discard_deleted(identity_map, child_model, [
+                        instance.__dict__[child_model._pk.name]
+                        for instance in children
+                    ])
+                else:
+                    child_model.query_manager.get_queryset()._refresh(
+                        children, PREFETCH_BATCH_SIZE, [fk.name]
+                    )
+
+    def _check_fk_names(self, *args, allow_reverse=False):
+        for fk in args:
+            if isinstance(
+                self.model._fields.get(fk), fields.ForeignKeyField
+            ):
+                continue
+            if allow_reverse and isinstance(
+                getattr(self.model, fk, None), fields.ReversedForeignKeyField
+            ):
+                continue
+            raise QueryError(
+                f'"{fk}" is not a ForeignKeyField '
+                f'{"or reverse relation " if allow_reverse else ""}'
+                f'of {self.model.__name__}'
+            )
+
+    @run_on_clone
+    def _save(self, model_instance, refresh=True):
+        """ Insert or update row of model instance.
+        Only changed fields are updated.
+        Returns instance made of the written row
+        or model_instance itself if refresh=False or nothing changed.
+        """
+        inst_dict = dict(model_instance.__dict__)
+        inst_id = inst_dict.pop(self.model_pk_name)
         if inst_id is None:
-            return self.create(**inst_dict)
+            written = self._insert(refresh, **inst_dict)
         else:
-            return self._update_and_get(**inst_dict)
+            changed = self._changed_values(model_instance, inst_dict)
+            if not changed:
+                return model_instance
+            written = self._update_row(inst_id, refresh, **changed)
+        if not refresh:
+            setattr(model_instance, self.model_pk_name, written)
+            model_instance._take_snapshot()
+            return model_instance
 
-    @clear_lookup_statements
-    def _update_and_get(self, **kwargs):
-        self.query.append_statement('UPDATE', **kwargs)
-        cursor = self._execute('update_stmt')
-        self.db.connection.commit()
+        return self.model._from_row(written, _related_instances(inst_dict))
+
+    def _changed_values(self, model_instance, inst_dict):
+        """ Values of changed fields to update.
+        Instance moved to another pk updates all fields of that row.
+        """
+        changed_fields = model_instance._changed_fields()
+        if self.model_pk_name in changed_fields:
+            return inst_dict
 
-        return self.get(**{self.model_pk_name: cursor.lastrowid})
+        return {
+            field_name: inst_dict[field_name]
+            for field_name in changed_fields if field_name in inst_dict
+        }
+
+    @run_on_clone
+    def create(self, *, refresh=True, **kwargs):
+        """ Insert row and return its instance.
+        The row is read back unless refresh=False:
+        then the instance is made of passed and default values.
+        """
+        # Passed values are validated by model fields and inserted
+        # as the instance holds them, like save() does
+        instance = self.model(**kwargs)
+        inst_dict = instance.__dict__
+        written = self._insert(
+            refresh, **{name: inst_dict[name] for name in kwargs}
+        )
+        if refresh:
+            instance = self.model._from_row(
+                written, _related_instances(inst_dict)
+            )
+        else:
+            setattr(instance, self.model_pk_name, written)
+            instance._take_snapshot()
+        identity_map = self._identity_map()
+
+        return instance if identity_map is None else \
+            identity_map.update(instance)
 
     @clear_lookup_statements
-    def create(self, **kwargs):
+    def _insert(self, refresh, **kwargs):
+        """ Returns inserted row if refresh=True or its pk otherwise """
         self.query.append_statement('INSERT', **kwargs)
-        cursor = self._execute('insert_stmt')
-        self.db.connection.commit()
+        if refresh:
+            return self._execute_and_read_back('insert_stmt')
 
-        return self.get(**{self.model_pk_name: cursor.lastrowid})
+        return self._execute('insert_stmt').lastrowid
 
     @clear_lookup_statements
-    def update(self, **kwargs):
+    def _update_row(self, inst_id, refresh, **kwargs):
+        """ Returns updated row if refresh=True or its pk otherwise """
         self.query.append_statement('UPDATE', **kwargs)
-        cursor = self._execute('update_stmt')
-        self.db.connection.commit()
+        self.query.append_statement('WHERE', **{self.model_pk_name: inst_id})
+        if refresh:
+            return self._execute_and_read_back('update_stmt', inst_id)
+
+        if not self._execute('update_stmt').rowcount:
+            raise self._does_not_exist(inst_id)
+        return inst_id
 
-        return cursor.rowcount
+    def _execute_and_read_back(self, query_attr, pk=None):
+        """ Execute INSERT or UPDATE and return the written row.
+        The row is returned by RETURNING if sqlite supports it,
+        otherwise it is selected by pk or last inserted rowid.
+        """
+        if self.query.returning_supported:
+            self.query.returning = list(self.model._columns)
+            cursor = self._execute(query_attr)
+            cursor.row_factory = None
+            rows = cursor.fetchall()
+        else:
+            cursor = self._execute(query_attr)
+            if pk is None:
+                pk = cursor.lastrowid
+            rows = self._select_rows(pk)
+        if not rows:
+            raise self._does_not_exist(pk)
 
-    def delete(self):
+        return rows[0]
+
+    def _select_rows(self, pk):
+        qs = self.model.query_manager.filter(**{self.model_pk_name: pk})
+        qs.query.append_statement('SELECT')
+
+        return qs._execute_select().fetchall()
+
+    def _does_not_exist(self, pk):
+        return ObjectDoesNotExistError(
+            f'Does not exist {self.model.__name__} '
+            f'with {self.model_pk_name}={pk}'
+        )
+
+    @clear_lookup_statements
+    def update(
+            self, *, batch_size=None, progress=None, returning=False,
+            **kwargs
+    ):
+        """ Update fields of matched rows.
+        Returns the number of rows updated or their pks if returning=True.
+        See delete() for batch_size and progress.
+        """
+        self._check_not_sliced('update')
+        _check_batch_size(batch_size)
+        self._result_cache = None
+        identity_map = self._identity_map()
+        # Pks of updated rows are needed to refresh mapped instances
+        with_pks = returning or bool(
+            identity_map and identity_map.instances(self.model)
+        )
+        if batch_size is None:
+            result = self._update_rows(with_pks, **kwargs)
+        else:
+            result = self._in_batches(
+                batch_size, progress, with_pks,
+                lambda qs: qs._update_rows(with_pks, **kwargs)
+            )
+        if with_pks and identity_map is not None:
+            self._refresh_updated(identity_map, result, list(kwargs))
+
+        return result if returning or not with_pks else len(result)
+
+    @run_on_clone
+    def _update_rows(self, returning, **kwargs):
         if self.query.should_be_joined:
-            # Join should be made.
-            # Make it upon 'pk' to create request "WHERE PK in (SELECT PK ...)
-            self.query.append_statement(
-                'SELECT', *(self.model_pk_name, )
+            # Joined lookups are made with "WHERE pk IN (SELECT pk ...)"
+            self.query.append_statement('SELECT', self.model_pk_name)
+        self.query.append_statement('UPDATE', **kwargs)
+
+        return self._execute_returning('update_stmt', returning)
+
+    def bulk_create(self, instances, batch_size=None, refresh=False):
+        """ Insert model instances with executemany in one transaction.
+        Autoincremented pks are set to instances.
+        Instances are re-selected from db only if refresh=True.
+        """
+        instances = list(instances)
+        pk_name = self.model_pk_name
+        fill_pk = isinstance(self.model._pk, fields.IntegerField)
+        with_pk, without_pk = _split_by_pk(instances, pk_name)
+        c = self.db.connection.cursor()
+        with self.db.atomic():
+            for insert_instances, columns in (
+                (without_pk, [
+                    field_name for field_name in self.model._fields
+                    if field_name != pk_name
+                ]),
+                (with_pk, list(self.model._fields)),
+            ):
+                if not insert_instances:
+                    continue
+                query = QuerySQL(self.model)
+                query.append_statement('INSERT', **dict.fromkeys(columns))
+                sql, _ = query.insert_stmt
+                for batch in _batches(insert_instances, batch_size):
+                    self._executemany(c, sql, [
+                        tuple(
+                            _db_value(inst.__dict__.get(column))
+                            for column in columns
+                        ) for inst in batch
+                    ])
+                    if insert_instances is with_pk or not fill_pk:
+                        continue
+                    # Rows inserted in one transaction get consecutive
+                    # rowids, so pks may be restored from the last one
+                    last_pk = self.db.execute(
+                        c, 'SELECT last_insert_rowid()'
+                    ).fetchone()[0]
+                    for pk, inst in enumerate(
+                        batch, start=last_pk - len(batch) + 1
+                    ):
+                        inst.__dict__[pk_name] = pk
+
+        if refresh:
+            self._refresh(instances, batch_size)
+        else:
+            for inst in instances:
+                inst._take_snapshot()
+        identity_map = self._identity_map()
+        if identity_map is not None:
+            instances = [identity_map.update(inst) for inst in instances]
+
+        return instances
+
+    def bulk_update(self, instances, fields, batch_size=None):
+        """ Update fields of model instances
+        with executemany in one transaction.
+        Returns the number of rows updated.
+        """
+        instances = list(instances)
+        pk_name = self.model_pk_name
+        columns = [
+            field_name for field_name in fields if field_name != pk_name
+        ]
+        for field_name in columns:
+            if field_name not in self.model._fields:
+                raise QueryError(
+                    f'"{field_name}" is not a field of {self.model.__name__}'
+                )
+        if not (instances and columns):
+            return 0
+        if any(inst.__dict__.get(pk_name) is None for inst in instances):
+            raise QueryError(
+                f'Can not update {self.model.__name__} instances without pk'
             )
-        cursor = self._execute('delete_stmt')
-        self.db.connection.commit()
 
-        return cursor.rowcount
+        query = QuerySQL(self.model)
+        query.append_statement('UPDATE', **dict.fromkeys(columns))
+        query.append_statement('WHERE', **{pk_name: None})
+        sql, _ = query.update_stmt
+        rowcount = 0
+        c = self.db.connection.cursor()
+        with self.db.atomic():
+            for batch in _batches(instances, batch_size):
+                self._executemany(c, sql, [
+                    tuple(
+                        _db_value(inst.__dict__.get(column))
+                        for column in columns
+                    ) + (inst.__dict__[pk_name], ) for inst in batch
+                ])
+                rowcount += c.rowcount
+        for inst in instances:
+            inst._take_snapshot(columns)
+        identity_map = self._identity_map()
+        if identity_map is not None:
+            for inst in instances:
+                identity_map.update(inst)
+
+        return rowcount
+
+    def _refresh(self, instances, batch_size=None, field_names=None):
+        """ Re-select instances from db, only field_names if passed.
+        Returns instances which rows were not found.
+        """
+        pk_name = self.model_pk_name
+        instances_by_pk = {
+            inst.__dict__[pk_name]: inst for inst in instances
+        }
+        for batch in _batches(list(instances_by_pk), batch_size):
+            for selected in self.model.query_manager.get_queryset(
+            )._no_identity_map().filter(**{
+                f'{pk_name}__in': batch
+            }).select_all():
+                instances_by_pk.pop(
+                    selected.__dict__[pk_name]
+                )._refresh_from(selected, field_names)
+
+        return list(instances_by_pk.values())
+
+    def delete(self, batch_size=None, progress=None, returning=False):
+        """ Delete matched rows.
+        Returns the number of rows deleted or their pks if returning=True.
+        With batch_size rows are deleted by pks selected in batches,
+        each batch in its own transaction, so the db is never locked
+        for long. progress(rows_count) is called after each batch.
+        Example: Book.filter(pages__lt=10).delete(batch_size=10000)
+        """
+        self._check_not_sliced('delete')
+        _check_batch_size(batch_size)
+        self._result_cache = None
+        identity_map = self._identity_map()
+        # Pks of deleted rows are needed to discard mapped instances
+        with_pks = returning or bool(identity_map)
+        if batch_size is None:
+            result = self._delete_rows(with_pks)
+        else:
+            result = self._in_batches(
+                batch_size, progress, with_pks,
+                lambda qs: qs._delete_rows(with_pks)
+            )
+        if identity_map:
+            self._discard_deleted(identity_map, self.model, result)
+
+        return result if returning or not with_pks else len(result)
+
+    @run_on_clone
+    def _delete_rows(self, returning):
+        if self.query.should_be_joined:
+            # Joined lookups are made with "WHERE pk IN (SELECT pk ...)"
+            self.query.append_statement('SELECT', self.model_pk_name)
+
+        return self._execute_returning('delete_stmt', returning)
+
+    def _execute_returning(self, query_attr, returning):
+        """ Execute DELETE or UPDATE.
+        Returns rowcount or pks of affected rows if returning=True.
+        """
+        if not returning:
+            return self._execute(query_attr).rowcount
+
+        if self.query.returning_supported:
+            self.query.returning = [self.model_pk_name]
+            cursor = self._execute(query_attr)
+            return [row[0] for row in cursor.fetchall()]
+
+        # Select pks in the same transaction
+        with self.db.atomic():
+            pks = self.values_list(self.model_pk_name, flat=True)
+            self._execute(query_attr)
+        return pks
+
+    def _in_batches(self, batch_size, progress, returning, modify_rows):
+        """ Run modify_rows(qs) in a transaction for each batch of pks.
+        Returns the number of rows modified or their pks.
+        """
+        rowcount, pks = 0, []
+        for batch in self._pk_batches(batch_size):
+            # Lookups are repeated: rows changed since their pks were
+            # selected are modified only if they still match
+            qs = self.filter(**{f'{self.model_pk_name}__in': batch})
+            with self.db.atomic():
+                result = modify_rows(qs)
+            if returning:
+                pks.extend(result)
+                rowcount += len(result)
+            else:
+                rowcount += result
+            if progress is not None:
+                progress(rowcount)
+
+        return pks if returning else rowcount
+
+    def _pk_batches(self, batch_size):
+        """ Yield lists of pks of matched rows by keyset pagination """
+        pk_name = self.model_pk_name
+        qs = self._clone()
+        qs.query.order_by = []
+        qs = qs.order_by(pk_name)
+        last_pk = None
+        while True:
+            batch_qs = qs if last_pk is None else \
+                qs.filter(**{f'{pk_name}__gt': last_pk})
+            pks = batch_qs[:batch_size].values_list(pk_name, flat=True)
+            if pks:
+                yield pks
+            if len(pks) < batch_size:
+                return
+            last_pk = pks[-1]
 
     @clear_lookup_statements
+    @run_on_clone
     def get(self, **kwargs):
+        identity_map = self._identity_map()
+        if identity_map is not None and not self.query.query_statements:
+            instance = self._get_mapped(identity_map, **kwargs)
+            if instance is not None:
+                return instance
+
         self.query.append_statement('SELECT', **kwargs)
         self.query.append_statement('WHERE', **kwargs)
-        cursor = self._execute('select_stmt')
+        cursor = self._execute_select()
 
         values = cursor.fetchall()
         values_len = len(values)
@@ -98,7 +837,16 @@ class QuerySet():
                 'Multiple objects error {self.model(**kwargs)}'
             )
 
-        return self.model(**dict(values[0]))
+        return self._hydrate(values)[0]
+
+    def _get_mapped(self, identity_map, **kwargs):
+        """ Get mapped instance if it is looked up by pk only """
+        if len(kwargs) != 1:
+            return None
+        (lookup, value), = kwargs.items()
+        if lookup not in (self.model_pk_name, f'{self.model_pk_name}__exact'):
+            return None
+        return identity_map.get(self.model, value)
 
     @clear_lookup_statements
     def get_or_create(self, **kwargs):
@@ -107,61 +855,428 @@ class QuerySet():
         except ObjectDoesNotExistError:
             return self.create(**kwargs)
 
+    @run_on_clone
     def select_all(self):
         self.query.append_statement('SELECT')
+        cursor = self._execute_select()
+
+        return self._hydrate(cursor.fetchall())
+
+    @run_on_clone
+    def values(self, *args):
+        self.query.append_statement(
+            'SELECT', with_fields_alias=True, *args
+        )
         cursor = self._execute('select_stmt')
-        values = cursor.fetchall()
 
         return [
-            self.model(
-                **dict(init_kwargs)
-            ) for init_kwargs in values
+            dict(values_row) for values_row in cursor.fetchall()
         ]
 
-    def values(self, *args):
+    def count(self):
+        """ Returns the number of rows with "SELECT COUNT(*)" """
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        if self.is_sliced:
+            return self._count_sliced()
+        return self.aggregate(count=Count())['count']
+
+    @run_on_clone
+    def _count_sliced(self):
+        self.query.append_statement('SELECT', self.model_pk_name)
+        cursor = self._execute('count_stmt')
+
+        return cursor.fetchone()[0]
+
+    def exists(self):
+        """ Checks if any row matches with "SELECT pk ... LIMIT 1" """
+        if self._result_cache is not None:
+            return bool(self._result_cache)
+        return self._exists()
+
+    @run_on_clone
+    def _exists(self):
+        self.query.append_statement('SELECT', self.model_pk_name)
+        self._slice(0, 1)
+        cursor = self._execute('select_stmt')
+
+        return cursor.fetchone() is not None
+
+    @run_on_clone
+    def aggregate(self, **kwargs):
+        """ Returns dict of aggregates over all rows.
+        Example: Book.filter(author__name='Jack').aggregate(
+            pages=Sum('pages'), books=Count()
+        )
+        """
+        self._check_not_sliced('aggregate')
+        if not kwargs:
+            raise QueryError('aggregate() needs at least one aggregate')
+        self.query.append_aggregates(**kwargs)
+        cursor = self._execute('select_stmt')
+
+        return dict(cursor.fetchone())
+
+    @run_on_clone
+    def annotate(self, *args, **kwargs):
+        """ Returns list of dicts of fields values and aggregates
+        grouped by the fields.
+        Example: Book.annotate('author__name', pages=Sum('pages'))
+        """
+        self._check_not_sliced('annotate')
         self.query.append_statement(
             'SELECT', with_fields_alias=True, *args
         )
+        self.query.append_aggregates(**kwargs)
+        self.query.append_group_by(*args)
         cursor = self._execute('select_stmt')
 
         return [
             dict(values_row) for values_row in cursor.fetchall()
         ]
 
+    @run_on_clone
+    def values_list(self, *args, flat=False, named=False):
+        """ Returns list of tuples of fields values.
+        flat=True returns list of values of the single field,
+        named=True returns list of namedtuples.
+        """
+        if flat and named:
+            raise QueryError('"flat" and "named" can not be used together')
+        if flat and len(args) != 1:
+            raise QueryError('"flat" is allowed only with a single field')
+        cursor = self._execute_values(*args)
+        rows = cursor.fetchall()
+
+        if flat:
+            return [values_row[0] for values_row in rows]
+        if named:
+            Row = namedtuple(
+                'Row', [column[0] for column in cursor.description]
+            )
+            return list(map(Row._make, rows))
+        return rows
+
+    @run_on_clone
+    def values_columns(
+            self, *args, chunk_size=ITERATOR_CHUNK_SIZE, use_numpy=None
+    ):
+        """ Returns dict of fields values by columns.
+        Integer and boolean columns are collected to array.array,
+        other ones (or columns containing NULL) to lists.
+        If use_numpy is True (default: if NumPy is installed)
+        columns are converted to NumPy arrays.
+        """
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        elif use_numpy and numpy is None:
+            raise QueryError('NumPy is not installed')
+        cursor = self._execute_values(*args)
+        names = [column[0] for column in cursor.description]
+        columns = []
+        for name in names:
+            typecode = _array_typecode(self._field(name))
+            columns.append([] if typecode is None else array(typecode))
+
+        for rows in _fetch_chunks(cursor, chunk_size):
+            for i, values in enumerate(zip(*rows)):
+                try:
+                    columns[i].extend(values)
+                except TypeError:
+                    # NULL in a typed column
+                    columns[i] = columns[i].tolist()
+                    columns[i].extend(values)
+
+        if use_numpy:
+            columns = [
+                numpy.array(column) if isinstance(column, array) else
+                numpy.array(column, dtype=object)
+                for column in columns
+            ]
+        return dict(zip(names, columns))
+
+    def _execute_values(self, *args):
+        """ Select fields values as plain tuples """
+        self.query.append_statement(
+            'SELECT', with_fields_alias=True,
+            *(args or self.model._columns)
+        )
+        cursor = self._execute('select_stmt')
+        cursor.row_factory = None
+
+        return cursor
+
+    def _field(self, field_name):
+        """ Get field of model or FK model along path: "fk__fk__field" """
+        model = self.model
+        *fk_path, field_name = field_name.split('__')
+        for fk in fk_path:
+            model = model._fields[fk].rel_model
+        return model._fields[field_name]
+
+    def iterator(self, chunk_size=ITERATOR_CHUNK_SIZE):
+        """ Yield model instances fetching rows by chunks,
+        so that the whole result set is never kept in memory.
+        """
+        for instances in self._iter_chunks(chunk_size):
+            yield from instances
+
+    @run_on_clone
+    def _iter_chunks(self, chunk_size):
+        self.query.append_statement('SELECT')
+        cursor = self._execute_select()
+
+        for rows in _fetch_chunks(cursor, chunk_size):
+            yield self._hydrate(rows)
+
+    async def aiter(self, chunk_size=ITERATOR_CHUNK_SIZE):
+        """ Async iterator over model instances.
+        Chunks are fetched by one executor worker
+        and handed to the event loop one chunk ahead of consumer.
+        Example: async for book in Book.filter(pages__gt=10).aiter()
+        """
+        loop = asyncio.get_event_loop()
+        chunks = asyncio.Queue()
+        chunk_consumed = threading.Semaphore(1)
+        stopped = threading.Event()
+
+        # Producer runs with identity map and captures of the caller
+        producer = asyncio.ensure_future(self.db.run_async(
+            self._produce_chunks,
+            chunk_size, loop, chunks, chunk_consumed, stopped
+        ))
+        try:
+            while True:
+                instances = await chunks.get()
+                if instances is _END_OF_CHUNKS:
+                    break
+                if isinstance(instances, Exception):
+                    raise instances
+                chunk_consumed.release()
+                for instance in instances:
+                    yield instance
+        finally:
+            stopped.set()
+            chunk_consumed.release()
+            await producer
+
+    def _produce_chunks(
+            self, chunk_size, loop, chunks, chunk_consumed, stopped
+    ):
+        """ Put hydrated chunks to the event loop queue
+        after the previous one was consumed
+        """
+        try:
+            for instances in self._iter_chunks(chunk_size):
+                chunk_consumed.acquire()
+                if stopped.is_set():
+                    return
+                loop.call_soon_threadsafe(chunks.put_nowait, instances)
+        except Exception as e:
+            loop.call_soon_threadsafe(chunks.put_nowait, e)
+        finally:
+            loop.call_soon_threadsafe(chunks.put_nowait, _END_OF_CHUNKS)
+
+    @run_on_clone
+    def values_iterator(self, *args, chunk_size=ITERATOR_CHUNK_SIZE):
+        """ Streaming variant of values() """
+        self.query.append_statement(
+            'SELECT', with_fields_alias=True, *args
+        )
+        cursor = self._execute('select_stmt')
+
+        for rows in _fetch_chunks(cursor, chunk_size):
+            for values_row in rows:
+                yield dict(values_row)
+
     @clear_lookup_statements
     def filter(self, **kwargs):
-        self.query.append_statement('WHERE', **kwargs)
+        qs = self._clone()
+        qs.query.append_statement('WHERE', **kwargs)
 
-        return self
+        return qs
+
+    def order_by(self, *args):
+        """ Order by fields, "-" prefix means descending order.
+        Example: Book.order_by('author__name', '-pages')
+        """
+        qs = self._clone()
+        qs.query.append_order_by(*args)
+
+        return qs
+
+    @run_on_clone
+    def first(self):
+        """ Returns the first instance (ordered by pk if not ordered)
+        or None
+        """
+        if not self.query.order_by:
+            self.query.append_order_by(self.model_pk_name)
+        self._slice(0, 1)
+        instances = self.select_all()
+
+        return instances[0] if instances else None
+
+    @run_on_clone
+    def last(self):
+        """ Returns the last instance (ordered by pk if not ordered)
+        or None
+        """
+        self._check_not_sliced('reverse')
+        self.query.reverse_order_by()
+
+        return self.first()
+
+    @run_on_clone
+    def paginate_after(self, pk=None, size=100):
+        """ Keyset pagination: returns up to size instances following
+        the one with given pk (the first page if pk is None).
+        Unlike OFFSET it does not skip rows, so every page costs the same.
+        QuerySet should be ordered by pk (default) or by "-pk".
+        Example:
+            page = Book.filter(pages__gt=10).paginate_after(None, 100)
+            page = Book.filter(pages__gt=10).paginate_after(page[-1].id, 100)
+        """
+        self._check_not_sliced('paginate')
+        pk_name = self.model_pk_name
+        order_by = self.query.order_by
+        if not order_by:
+            self.query.append_order_by(pk_name)
+        pk_column = self.query._field_column(pk_name)
+        if order_by == [f'{pk_column} ASC']:
+            lookup = 'gt'
+        elif order_by == [f'{pk_column} DESC']:
+            lookup = 'lt'
+        else:
+            raise QueryError(
+                'Keyset pagination requires QuerySet ordered by pk only'
+            )
+        qs = self
+        if pk is not None:
+            qs = self.filter(**{f'{pk_name}__{lookup}': pk})
+        qs._slice(0, size)
+
+        return qs.select_all()
+
+    def select_related(self, *args):
+        """ Select FK models with the same query using JOIN.
+        Example: Book.select_related('author').select_all()
+        """
+        self._check_fk_names(*args)
+        qs = self._clone()
+        qs.query.append_related(*args)
 
+        return qs
+
+    def prefetch_related(self, *args):
+        """ Select FK models with one "pk IN (...)" query per FK.
+        Reverse relations are selected with one "fk IN (...)" query
+        and cached on instances.
+        Example:
+            Book.prefetch_related('author').select_all()
+            for author in Author.prefetch_related('books', 'cobooks'):
+                books = list(author.books)  # no query
+        """
+        self._check_fk_names(*args, allow_reverse=True)
+        qs = self._clone()
+        for fk in args:
+            if fk not in qs.prefetch_fields:
+                qs.prefetch_fields.append(fk)
+
+        return qs
+
+    @run_on_clone
     def create_table(self):
-        self._execute('create_table_stmt')
-        self.db.connection.commit()
+        """ Create table and its indexes if not exist """
+        with self.db.atomic():
+            c = self._execute('create_table_stmt')
+            for stmt in self.query.create_indexes_stmts:
+                self.querystring, self.queryparams = stmt
+                self._execute_with(c)
 
         return True
 
+    @run_on_clone
     def drop_table(self):
         self._execute('drop_table_stmt')
-        self.db.connection.commit()
 
         return True
 
     def _execute(self, query_attr):
         c = self.db.connection.cursor()
-        c.execute("PRAGMA foreign_keys = ON")
-        self.querystring = f'{getattr(self.query, query_attr)};'
+        self.querystring, self.queryparams = getattr(self.query, query_attr)
+
+        return self._execute_with(c)
+
+    def _execute_with(self, c):
+        """ Execute querystring with queryparams using cursor """
         try:
-            c.execute(self.querystring)
+            self.db.execute(c, self.querystring, self.queryparams)
         except OperationalError as e:
-            raise DbOperationError(str(e), self.querystring)
+            raise DbOperationError(
+                str(e), self.querystring, self.queryparams
+            )
 
         return c
 
+    def _executemany(self, cursor, querystring, seq_of_params):
+        try:
+            self.db.execute(cursor, querystring, seq_of_params, many=True)
+        except OperationalError as e:
+            raise DbOperationError(str(e), querystring)
+
+        return cursor
+
+    # Async facade: run queries with db executor,
+    # e.g. await Book.filter(pages__gt=10).aselect_all()
+    aget = _async_method('get')
+    aget_or_create = _async_method('get_or_create')
+    acreate = _async_method('create')
+    aupdate = _async_method('update')
+    adelete = _async_method('delete')
+    aselect_all = _async_method('select_all')
+    avalues = _async_method('values')
+    acount = _async_method('count')
+    aexists = _async_method('exists')
+    aaggregate = _async_method('aggregate')
+    afirst = _async_method('first')
+    alast = _async_method('last')
+    apaginate_after = _async_method('paginate_after')
+    aannotate = _async_method('annotate')
+    avalues_list = _async_method('values_list')
+    avalues_columns = _async_method('values_columns')
+    abulk_create = _async_method('bulk_create')
+    abulk_update = _async_method('bulk_update')
+    acreate_table = _async_method('create_table')
+    adrop_table = _async_method('drop_table')
+
 
 class QueryManager:
+    """ Query entry point of a model: Book.query_manager.filter(...).
+    MANAGER_METHODS are bound once to a base QuerySet, which is never
+    changed since QuerySet methods run on its clones.
+    bind_to_model() sets them to model class: Book.filter(...).
+    """
 
     def __init__(self, db, model):
         self.db, self.model = db, model
+        base_queryset = self.get_queryset()
+        base_queryset._is_base = True
+        for method_name in MANAGER_METHODS:
+            setattr(self, method_name, getattr(base_queryset, method_name))
 
     def get_queryset(self):
         return QuerySet(self)
+
+    def bind_to_model(self):
+        """ Set manager and its methods to model class.
+        Model attributes of the same names (fields, methods) are kept,
+        their queries are made with Model.query_manager.
+        """
+        self.model.query_manager = self
+        for method_name in MANAGER_METHODS:
+            model_attr = getattr(self.model, method_name, None)
+            if model_attr is None or isinstance(
+                getattr(model_attr, '__self__', None), QuerySet
+            ):
+                setattr(self.model, method_name, getattr(self, method_name))
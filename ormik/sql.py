@@ -1,6 +1,14 @@
+import sqlite3
+import threading
+
+from collections import OrderedDict
+
 from ormik import QueryError, fields
 
-__all__ = ['FieldSQL', 'QuerySQL']
+__all__ = [
+    'FieldSQL', 'QuerySQL', 'StatementCache', 'Index',
+    'Aggregate', 'Count', 'Sum', 'Avg', 'Min', 'Max',
+]
 
 
 NULL = 'NULL'
@@ -63,27 +71,122 @@ class FieldSQL:
         return self._generate_fk_constraints()
 
 
-def _normalize_lookup_value(lookup_statement, lookup_value):
+def _lookup_param(lookup_statement, lookup_value):
     if lookup_statement == 'LIKE':
-        lookup_value = f"'%{lookup_value}%'"
-    elif lookup_statement == 'IN':
-        lookup_value = f'{tuple(lookup_value)}'
-    else:
-        if isinstance(lookup_value, str):
-            lookup_value = f"'{lookup_value}'"
-
+        return f'%{lookup_value}%'
     return lookup_value
 
 
-def _normalize_field_value(field_value):
-    if isinstance(field_value, str):
-        field_value = f"'{field_value}'"
-    if field_value is None:
-        field_value = NULL
-    return field_value
+def _lookup_placeholder(lookup_statement, lookup_value):
+    if lookup_statement == 'IN':
+        return f"({', '.join(['?'] * len(lookup_value))})"
+    return '?'
+
+
+class Index:
+    """ Model index on one or more fields.
+    Example: __indexes__ = [Index('author', 'title', unique=True)]
+    """
+
+    def __init__(self, *field_names, unique=False, name=None):
+        self.field_names = field_names
+        self.unique = unique
+        self.name = name
+
+    def __repr__(self):
+        return (
+            f'{self.__class__.__name__}'
+            f'({", ".join(self.field_names)}, unique={self.unique})'
+        )
+
+    def index_name(self, table):
+        return self.name or f'{table}_{"_".join(self.field_names)}_idx'
+
+
+class Aggregate:
+    """ SQL aggregate function over a field: Sum('pages'), Count('*').
+    FK fields are allowed: Max('author__name').
+    """
+
+    function = None
+
+    def __init__(self, field_name, distinct=False):
+        self.field_name = field_name
+        self.distinct = distinct
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.field_name!r})'
+
+    def as_sql(self, column):
+        distinct = 'DISTINCT ' if self.distinct else ''
+        return f'{self.function}({distinct}{column})'
+
+
+class Count(Aggregate):
+    function = 'COUNT'
+
+    def __init__(self, field_name='*', distinct=False):
+        super().__init__(field_name, distinct)
+
+
+class Sum(Aggregate):
+    function = 'SUM'
+
+
+class Avg(Aggregate):
+    function = 'AVG'
+
+
+class Min(Aggregate):
+    function = 'MIN'
+
+
+class Max(Aggregate):
+    function = 'MAX'
+
+
+class StatementCache:
+    """ LRU cache of generated SQL keyed on the query shape.
+    Shared by threads: LRU order is changed under a lock.
+    """
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._statements = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._statements)
+
+    def get_or_compile(self, shape, compile_sql):
+        statements = self._statements
+        with self._lock:
+            sql = statements.get(shape)
+            if sql is not None:
+                self.hits += 1
+                statements.move_to_end(shape)
+                return sql
+            self.misses += 1
+
+        # Compiled outside of the lock: concurrent misses may compile twice
+        sql = compile_sql()
+        with self._lock:
+            statements[shape] = sql
+            if len(statements) > self.maxsize:
+                statements.popitem(last=False)
+        return sql
+
+    def clear(self):
+        with self._lock:
+            self._statements.clear()
+            self.hits = self.misses = 0
 
 
 class QuerySQL:
+    """ Generates SQL with "?" placeholders.
+    Statement properties return (sql, params) pair.
+    """
 
     PRIMARY_MODEL_KEY = 'PRIMARYMODELKEY'
 
@@ -98,17 +201,81 @@ class QuerySQL:
         'is': 'IS',
     }
 
+    statement_cache = StatementCache()
+    # DELETE/UPDATE ... RETURNING is available since SQLite 3.35
+    returning_supported = sqlite3.sqlite_version_info >= (3, 35, 0)
+
     def __init__(self, model, *args, **kwargs):
         self.model = model
         self.query_statements = {}
         self.fk_joins = {
             self.PRIMARY_MODEL_KEY: 't0'
         }
+        self.related_fields = []
+        self.group_by = []
+        self.order_by = []
+        self.limit = None
+        self.offset = None
+        self.returning = []
+
+    def clone(self):
+        """ Copy of the query which may be changed independently """
+        query = self.__class__.__new__(self.__class__)
+        query.__dict__.update(self.__dict__)
+        query.query_statements = {
+            statement_alias: {
+                'fields': list(statement_meta['fields']),
+                'lookups': dict(statement_meta['lookups']),
+            } for statement_alias, statement_meta in
+            self.query_statements.items()
+        }
+        query.fk_joins = dict(self.fk_joins)
+        query.related_fields = list(self.related_fields)
+        query.group_by = list(self.group_by)
+        query.order_by = list(self.order_by)
+        query.returning = list(self.returning)
+        return query
 
     @property
     def should_be_joined(self):
         return len(self.fk_joins) > 1
 
+    @property
+    def shape(self):
+        """ Query description without lookup values """
+        statements_shape = tuple(
+            (
+                statement_alias,
+                tuple(statement_meta['fields']),
+                tuple(
+                    (
+                        field,
+                        lookup_statement,
+                        len(lookup_value) if lookup_statement == 'IN'
+                        else None
+                    ) for field, (
+                        lookup_statement, lookup_value
+                    ) in statement_meta['lookups'].items()
+                )
+            ) for statement_alias, statement_meta in
+            self.query_statements.items()
+        )
+        return (
+            tuple(self.fk_joins.items()),
+            tuple(self.related_fields),
+            statements_shape,
+            tuple(self.group_by),
+            tuple(self.order_by),
+            self.limit is not None,
+            self.offset is not None,
+            tuple(self.returning),
+        )
+
+    def _compile(self, statement_kind, compile_sql):
+        return self.statement_cache.get_or_compile(
+            (self.model, statement_kind, self.shape), compile_sql
+        )
+
     @property
     def create_table_stmt(self):
         columns_definition_list, table_constraints_list = [], []
@@ -129,26 +296,105 @@ class QuerySQL:
             f'{columns_definition_sql}'
             f'{table_constraints_sql}'
             f')'
-        )
+        ), ()
+
+    @property
+    def create_indexes_stmts(self):
+        table = self.model._table
+        stmts = []
+        for index in self.model._indexes:
+            unique = 'UNIQUE ' if index.unique else ''
+            stmts.append((
+                f'CREATE {unique}INDEX IF NOT EXISTS '
+                f'{index.index_name(table)} '
+                f'ON {table} ({", ".join(index.field_names)})',
+                ()
+            ))
+        return stmts
 
     @property
     def drop_table_stmt(self):
-        return f'DROP TABLE {self.model._table}'
+        return f'DROP TABLE {self.model._table}', ()
 
     @property
     def insert_stmt(self):
+        return (
+            self._compile('INSERT', self._sql_insert),
+            self._statement_params('INSERT')
+        )
+
+    @property
+    def select_stmt(self):
+        return (
+            self._compile('SELECT', self._sql_select),
+            self._statement_params('WHERE') + self._limit_params()
+        )
+
+    @property
+    def count_stmt(self):
+        """ Count rows of the select, LIMIT/OFFSET are applied first """
+        sql, params = self.select_stmt
+        return f'SELECT COUNT(*) FROM ({sql})', params
+
+    @property
+    def delete_stmt(self):
+        return (
+            self._compile('DELETE', self._sql_delete),
+            self._statement_params('WHERE')
+        )
+
+    @property
+    def update_stmt(self):
+        params = self._statement_params('UPDATE', skip_pk=True)
+        return (
+            self._compile('UPDATE', self._sql_update),
+            params + self._statement_params('WHERE')
+        )
+
+    def _limit_params(self):
+        params = ()
+        if self.limit is not None or self.offset is not None:
+            # Negative LIMIT means no limit in SQLite
+            params += (-1 if self.limit is None else self.limit, )
+        if self.offset is not None:
+            params += (self.offset, )
+        return params
+
+    def _statement_params(self, statement_alias, skip_pk=False):
+        if statement_alias not in self.query_statements:
+            return ()
+
+        params = []
+        pk_field = f'{self.fk_joins[self.PRIMARY_MODEL_KEY]}.' \
+            f'{self.model._pk.name}'
+        for (field, _), (
+            lookup_statement, lookup_value
+        ) in self.query_statements[statement_alias]['lookups'].items():
+            if skip_pk and field == pk_field:
+                continue
+            if lookup_statement == 'IN':
+                params.extend(lookup_value)
+            else:
+                params.append(_lookup_param(lookup_statement, lookup_value))
+        return tuple(params)
+
+    def _sql_insert(self):
         (
             sql_columns_statement,
             sql_values_statement
         ) = self._sql_insert_statement()
 
-        return (
+        sql = (
             f'INSERT INTO {self.model._table}({sql_columns_statement}) '
             f'VALUES ({sql_values_statement})'
         )
 
-    @property
-    def select_stmt(self):
+        if self.returning:
+            sql += f" RETURNING {', '.join(self.returning)}"
+
+        return sql
+
+    def _sql_select(self):
         sql_select_statement = self._sql_select_statement()
         sql_from_statement = self._sql_from_statement()
         sql_where_statement = self._sql_where_statement()
@@ -161,107 +407,181 @@ class QuerySQL:
         if sql_where_statement:
             sql += f' WHERE {sql_where_statement}'
 
+        if self.group_by:
+            sql += f" GROUP BY {', '.join(self.group_by)}"
+
+        if self.order_by:
+            sql += f" ORDER BY {', '.join(self.order_by)}"
+
+        if self.limit is not None or self.offset is not None:
+            sql += ' LIMIT ?'
+
+        if self.offset is not None:
+            sql += ' OFFSET ?'
+
         return sql
 
-    @property
-    def delete_stmt(self):
-        if self.should_be_joined:
-            sql_where_statement = (
-                f'{self.model._pk.name} IN ({self.select_stmt})'
-            )
-        else:
-            sql_where_statement = self._sql_where_statement(
-                split_table_alias=True
-            )
+    def _sql_delete(self):
+        sql = f'DELETE FROM {self.model._table}'
 
-        return (
-            f'DELETE FROM {self.model._table} '
-            f'WHERE {sql_where_statement}'
-        )
+        return self._sql_modify_where(sql)
 
-    @property
-    def update_stmt(self):
-        if self.should_be_joined:
-            raise QueryError(
-                'QuerySet can only update columns in the model’s main table'
-            )
+    def _sql_update(self):
+        primary_alias = self.fk_joins[self.PRIMARY_MODEL_KEY]
+        for field, _ in self.query_statements['UPDATE']['lookups']:
+            if not field.startswith(f'{primary_alias}.'):
+                raise QueryError(
+                    'QuerySet can only update columns '
+                    'in the model’s main table'
+                )
         sql_update_statement = self._sql_update_statement()
-        sql_where_statement = self._sql_where_statement(split_table_alias=True)
 
         sql = (
             f'UPDATE {self.model._table} '
             f'SET {sql_update_statement}'
         )
 
+        return self._sql_modify_where(sql)
+
+    def _sql_modify_where(self, sql):
+        """ Add WHERE and RETURNING clauses to DELETE or UPDATE.
+        Joined lookups are made with "pk IN (SELECT pk ...)"
+        """
+        if self.should_be_joined:
+            sql_where_statement = (
+                f'{self.model._pk.name} IN ({self._sql_select()})'
+            )
+        else:
+            sql_where_statement = self._sql_where_statement(
+                split_table_alias=True
+            )
+
         if sql_where_statement:
             sql += f' WHERE {sql_where_statement}'
 
+        if self.returning:
+            sql += f" RETURNING {', '.join(self.returning)}"
+
         return sql
 
     def _sql_insert_statement(self):
-        columns, values = [], []
-        for field, (
-            _, field_value
-        ) in self.query_statements['INSERT']['lookups'].items():
+        columns = []
+        for field, _ in self.query_statements['INSERT']['lookups']:
             table_alias, field_name = field.split('.')
-            field_value = _normalize_field_value(field_value)
-
             columns.append(f"'{field_name}'")
-            values.append(f"{field_value}")
 
-        return ', '.join(columns), ', '.join(values)
+        return ', '.join(columns), ', '.join(['?'] * len(columns))
 
     def _sql_update_statement(self):
         sql_update_statement = []
-        for field, (
-            _, value
-        ) in self.query_statements['UPDATE']['lookups'].items():
+        for field, _ in self.query_statements['UPDATE']['lookups']:
             table_alias, field_name = field.split('.')
             if field_name == self.model._pk.name:
                 # PK can not be updated
                 continue
-            value = _normalize_field_value(value)
-            sql_update_statement.append(f'{field_name} = {value}')
+            sql_update_statement.append(f'{field_name} = ?')
         return ', '.join(sql_update_statement)
 
     def _sql_select_statement(self):
         select_fields = self.query_statements['SELECT']['fields']
-        sql_select_statement = ', '.join(
-            select_fields
-        ) if select_fields else ', '.join(
-            [f'{alias}.*' for alias in self.fk_joins.values()]
-        )
-        return sql_select_statement
+        if select_fields:
+            return ', '.join(select_fields)
+
+        # Select model columns explicitly so that joined tables
+        # do not shadow them, and add columns of related models
+        # prefixed with FK name: "author__name"
+        primary_alias = self.fk_joins[self.PRIMARY_MODEL_KEY]
+        select_fields = [
+            f'{primary_alias}.{field_name}'
+            for field_name in self.model._columns
+        ]
+        for fk in self.related_fields:
+            rel_model = self.model._fields[fk].rel_model
+            select_fields.extend([
+                f'{self.fk_joins[fk]}.{field_name} AS {fk}__{field_name}'
+                for field_name in rel_model._columns
+            ])
+        return ', '.join(select_fields)
 
     def _sql_from_statement(self):
         sql_from_statement = (
             f'{self.model._table} '
-            f'AS {self.fk_joins.pop(self.PRIMARY_MODEL_KEY)}'
+            f'AS {self.fk_joins[self.PRIMARY_MODEL_KEY]}'
         )
-        for field, table_alias in self.fk_joins.items():
+        inner_join_paths = self._inner_join_paths()
+        for fk_path, table_alias in self.fk_joins.items():
+            if fk_path == self.PRIMARY_MODEL_KEY:
+                continue
+            parent_path, _, fk = fk_path.rpartition('__')
+            parent_alias = self.fk_joins[parent_path or self.PRIMARY_MODEL_KEY]
+            rel_model = self._fk_fields(fk_path)[-1].rel_model
+            join = 'INNER JOIN' if fk_path in inner_join_paths else 'LEFT JOIN'
             sql_from_statement += (
-                f' LEFT JOIN {self.model._fields[field].rel_model._table} '
-                f'AS {table_alias} '
-                f'ON t0.{field} = '
-                f'{table_alias}.{self.model._fields[field].rel_model._pk.name}'
+                f' {join} {rel_model._table} AS {table_alias} '
+                f'ON {parent_alias}.{fk} = '
+                f'{table_alias}.{rel_model._pk.name}'
             )
         return sql_from_statement
 
+    def _inner_join_paths(self):
+        """ FK paths which may be joined with INNER JOIN:
+        FK models looked up in WHERE (rows without them would not match
+        the lookup anyway) with their parent joins,
+        and not nullable FKs of inner joined (or the main) models.
+        """
+        alias_paths = {
+            table_alias: fk_path
+            for fk_path, table_alias in self.fk_joins.items()
+        }
+        inner_join_paths = {self.PRIMARY_MODEL_KEY}
+        where_lookups = self.query_statements.get(
+            'WHERE', {'lookups': {}}
+        )['lookups']
+        for (column, lookup_statement), _ in where_lookups.items():
+            fk_path = alias_paths[column.split('.')[0]]
+            if lookup_statement == 'IS' or fk_path == self.PRIMARY_MODEL_KEY:
+                continue
+            fks = fk_path.split('__')
+            inner_join_paths.update(
+                '__'.join(fks[:i]) for i in range(1, len(fks) + 1)
+            )
+
+        # Parent paths are joined first
+        for fk_path in self.fk_joins:
+            parent_path = fk_path.rpartition('__')[0] or self.PRIMARY_MODEL_KEY
+            if fk_path in inner_join_paths or \
+                    parent_path not in inner_join_paths:
+                continue
+            if not self._fk_fields(fk_path)[-1].is_nullable:
+                inner_join_paths.add(fk_path)
+        return inner_join_paths
+
+    def _fk_fields(self, fk_path):
+        """ ForeignKeyFields along FK path: "author__publisher" """
+        model, fk_fields = self.model, []
+        for fk in fk_path.split('__'):
+            fk_field = model._fields.get(fk)
+            if not isinstance(fk_field, fields.ForeignKeyField):
+                raise QueryError(
+                    f'"{fk}" is not a ForeignKeyField of {model.__name__}'
+                )
+            fk_fields.append(fk_field)
+            model = fk_field.rel_model
+        return fk_fields
+
     def _sql_where_statement(self, split_table_alias=False):
         if 'WHERE' not in self.query_statements:
             return
 
         sql_where_statement = []
-        for field_name, (
+        for (field_name, _), (
             lookup_statement, lookup_value
         ) in self.query_statements['WHERE']['lookups'].items():
             if split_table_alias:
                 table_alias, field_name = field_name.split('.')
-            lookup_value = _normalize_lookup_value(
-                lookup_statement, lookup_value
-            )
+            placeholder = _lookup_placeholder(lookup_statement, lookup_value)
             sql_where_statement.append(
-                f'{field_name} {lookup_statement} {lookup_value}'
+                f'{field_name} {lookup_statement} {placeholder}'
             )
         return ' AND '.join(sql_where_statement)
 
@@ -270,43 +590,100 @@ class QuerySQL:
         statement_fields, with_fields_alias=False,
         *args
     ):
-        fk_joins = self.fk_joins
         for field_name in args:
-            field_alias = field_name
-            fk = self.PRIMARY_MODEL_KEY
-            if '__' in field_name:
-                # Field name is FK
-                fk, field_name = field_name.split('__')
-                if fk not in fk_joins:
-                    fk_joins[fk] = f't{len(fk_joins)}'
-            statement_field = f'{fk_joins[fk]}.{field_name}'
+            statement_field = self._field_column(field_name)
             if with_fields_alias:
-                statement_field += f' AS {field_alias}'
+                statement_field += f' AS {field_name}'
 
             statement_fields.append(statement_field)
 
-    def _fill_statement_lookups(self, statement_lookups, **kwargs):
+    def _field_column(self, field_name):
+        """ Table alias prefixed column: "t0.title", "t1.name".
+        Field name may span FK path: "author__publisher__name"
+        """
+        *fk_path, field_name = field_name.split('__')
+        return f'{self._join(fk_path)}.{field_name}'
+
+    def _join(self, fk_path):
+        """ Join FK models along FK path, e.g. ['author', 'publisher'].
+        Each path prefix is joined once and its alias is reused.
+        Returns table alias of the last FK model.
+        """
         fk_joins = self.fk_joins
+        if not fk_path:
+            return fk_joins[self.PRIMARY_MODEL_KEY]
+
+        self._fk_fields('__'.join(fk_path))
+        for i in range(1, len(fk_path) + 1):
+            path = '__'.join(fk_path[:i])
+            if path not in fk_joins:
+                fk_joins[path] = f't{len(fk_joins)}'
+        return fk_joins[path]
+
+    def _fill_statement_lookups(self, statement_lookups, **kwargs):
         for field_lookup, lookup_value in kwargs.items():
-            fk = self.PRIMARY_MODEL_KEY
             field_lookup_bricks = field_lookup.split('__')
-            if field_lookup_bricks[-1] not in self.FIELD_LOOKUP_MAPPING:
-                field_lookup_bricks.append('exact')
-
-            if len(field_lookup_bricks) > 2:
-                # Field is FK
-                fk = field_lookup_bricks.pop(0)
+            lookup_statement = 'exact'
+            if field_lookup_bricks[-1] in self.FIELD_LOOKUP_MAPPING:
+                lookup_statement = field_lookup_bricks.pop()
+
+            # The same field may be looked up with different operators:
+            # filter(pages__gt=10, pages__lt=100)
+            lookup_statement = self.FIELD_LOOKUP_MAPPING[lookup_statement]
+            statement_lookups[(
+                self._field_column('__'.join(field_lookup_bricks)),
+                lookup_statement
+            )] = (lookup_statement, lookup_value)
+
+    def append_related(self, *args):
+        """ JOIN FK models to select their columns with the main model """
+        for fk in args:
+            self._join([fk])
+            if fk not in self.related_fields:
+                self.related_fields.append(fk)
+
+    def append_aggregates(self, **aggregates):
+        """ Select aggregates: total=Sum('pages') """
+        statement_meta = self.query_statements.setdefault(
+            'SELECT', {'fields': [], 'lookups': {}}
+        )
+        for alias, aggregate in aggregates.items():
+            if not isinstance(aggregate, Aggregate):
+                raise QueryError(f'{aggregate!r} is not an aggregate')
+            column = '*' if aggregate.field_name == '*' else \
+                self._field_column(aggregate.field_name)
+            statement_meta['fields'].append(
+                f'{aggregate.as_sql(column)} AS {alias}'
+            )
 
-            field_name, lookup_statement = field_lookup_bricks
-            if fk not in fk_joins:
-                fk_joins[fk] = f't{len(fk_joins)}'
+    def append_group_by(self, *args):
+        """ GROUP BY fields, FK fields are allowed: "author__name" """
+        for field_name in args:
+            column = self._field_column(field_name)
+            if column not in self.group_by:
+                self.group_by.append(column)
 
-            statement_lookups[
-                f'{fk_joins[fk]}.{field_name}'
-            ] = (
-                f'{self.FIELD_LOOKUP_MAPPING[lookup_statement]}', lookup_value
+    def append_order_by(self, *args):
+        """ ORDER BY fields, "-" prefix means descending order """
+        for field_name in args:
+            direction = 'ASC'
+            if field_name.startswith('-'):
+                field_name, direction = field_name[1:], 'DESC'
+            self.order_by.append(
+                f'{self._field_column(field_name)} {direction}'
             )
 
+    def reverse_order_by(self):
+        """ Flip direction of ordering, order by pk DESC if not ordered """
+        if not self.order_by:
+            self.append_order_by(f'-{self.model._pk.name}')
+            return
+        self.order_by = [
+            column[:-len(' ASC')] + ' DESC' if column.endswith(' ASC') else
+            column[:-len(' DESC')] + ' ASC'
+            for column in self.order_by
+        ]
+
     def append_statement(
             self,
             statement_alias,
@@ -21,3 +21,11 @@ def model():
         id = fields.AutoField()
 
     return Model
+
+
+@pytest.fixture
+def memory_database():
+    database = db.SqliteDatabase(':memory:')
+    database.connection.execute('CREATE TABLE item (name VARCHAR)')
+    yield database
+    database.connection.close()
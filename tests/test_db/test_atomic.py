@@ -0,0 +1,41 @@
+import pytest
+
+
+def _item_names(database):
+    return [
+        row['name'] for row in
+        database.connection.execute('SELECT name FROM item ORDER BY name')
+    ]
+
+
+def test_atomic_commits_and_rolls_back_nested_blocks(memory_database):
+    connection = memory_database.connection
+    with memory_database.atomic():
+        connection.execute("INSERT INTO item VALUES ('outer')")
+        with pytest.raises(ZeroDivisionError):
+            with memory_database.atomic():
+                connection.execute("INSERT INTO item VALUES ('inner')")
+                1 / 0
+        assert memory_database.in_transaction
+    assert not memory_database.in_transaction
+    assert not connection.in_transaction
+    assert _item_names(memory_database) == ['outer']
+
+    with pytest.raises(ZeroDivisionError):
+        with memory_database.atomic():
+            connection.execute("INSERT INTO item VALUES ('rolled back')")
+            1 / 0
+    assert _item_names(memory_database) == ['outer']
+
+
+def test_atomic_as_decorator(memory_database):
+    @memory_database.atomic()
+    def insert(name):
+        assert memory_database.in_transaction
+        memory_database.connection.execute(
+            'INSERT INTO item VALUES (?)', (name, )
+        )
+
+    insert('first')
+    insert('second')
+    assert _item_names(memory_database) == ['first', 'second']
@@ -1,6 +1,6 @@
 import pytest
 
-from ormik import ModelRegistrationError
+from ormik import ModelRegistrationError, models, fields
 
 
 def test_models_registered_in_db_should_be_model_instances(
@@ -9,3 +9,40 @@ def test_models_registered_in_db_should_be_model_instances(
     database.register_models([model])  # No error
     with pytest.raises(ModelRegistrationError):
         database.register_models(['No model'])
+
+
+def test_register_models_binds_manager_methods(database):
+
+    class Counter(models.Model):
+        id = fields.AutoField()
+        count = fields.IntegerField()
+
+    database.register_models([Counter])
+    manager = Counter.query_manager
+
+    assert Counter.filter is manager.filter
+    assert Counter.filter.__self__.model is Counter
+    # Fields are not shadowed by query methods
+    assert Counter.count is Counter._fields['count']
+    assert manager.count.__name__ == 'count'
+
+    database.register_models([Counter])
+    assert Counter.filter is Counter.query_manager.filter
+    assert Counter.query_manager is not manager
+
+
+def test_base_queryset_is_not_changed_by_its_clones(database):
+
+    class Counter(models.Model):
+        id = fields.AutoField()
+        count = fields.IntegerField()
+
+    database.register_models([Counter])
+    base_queryset = Counter.filter.__self__
+    qs = Counter.filter(count__gt=1).prefetch_related()
+
+    assert qs.filter(count__lt=5).query.query_statements
+    assert not base_queryset.query.query_statements
+    assert not base_queryset.prefetch_fields
+    assert not qs._is_base
+    assert Counter.filter().query is not base_queryset.query
@@ -0,0 +1,76 @@
+import threading
+
+import pytest
+
+from ormik import db, PoolTimeoutError, DbOperationError
+
+
+@pytest.fixture
+def pooled_database(tmp_path):
+    database = db.PooledSqliteDatabase(
+        str(tmp_path / 'pool.db'), max_connections=2, timeout=0.1
+    )
+    yield database
+    database.close()
+
+
+def _in_thread(func):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(func()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_each_thread_gets_own_connection(pooled_database):
+    connection = pooled_database.connection
+
+    assert pooled_database.connection is connection
+    assert _in_thread(lambda: pooled_database.connection) is not connection
+    assert pooled_database.connections_count == 2
+
+
+def test_released_connection_is_reused(pooled_database):
+    with pooled_database.connection_context() as connection:
+        connection.execute('CREATE TABLE item (name VARCHAR)')
+
+    assert pooled_database.idle_count == 1
+    assert pooled_database.connection is connection
+    assert pooled_database.idle_count == 0
+
+
+def test_pool_checkout_timeout(pooled_database):
+    barrier = threading.Barrier(3)
+    done = threading.Event()
+
+    def hold_connection():
+        with pooled_database.connection_context():
+            barrier.wait()
+            done.wait()
+
+    threads = [threading.Thread(target=hold_connection) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    with pytest.raises(PoolTimeoutError):
+        pooled_database.connection
+    done.set()
+    for thread in threads:
+        thread.join()
+
+    assert pooled_database.connection is not None
+
+
+def test_connections_of_finished_threads_are_reclaimed(pooled_database):
+    _in_thread(lambda: pooled_database.connection)
+    _in_thread(lambda: pooled_database.connection)
+
+    assert pooled_database.connection is not None
+    assert pooled_database.connections_count == 2
+
+
+def test_closed_pool_does_not_give_connections(pooled_database):
+    pooled_database.close()
+
+    with pytest.raises(DbOperationError):
+        pooled_database.connection
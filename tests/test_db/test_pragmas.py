@@ -0,0 +1,30 @@
+import pytest
+
+from ormik import db, DbOperationError
+
+
+def _pragma(database, pragma):
+    return database.connection.execute(f'PRAGMA {pragma}').fetchone()[0]
+
+
+def test_pragmas_profile_is_applied_to_connection(tmp_path):
+    database = db.SqliteDatabase(
+        str(tmp_path / 'pragmas.db'), pragmas='performance'
+    )
+
+    assert _pragma(database, 'journal_mode') == 'wal'
+    assert _pragma(database, 'synchronous') == 1  # NORMAL
+    assert _pragma(database, 'foreign_keys') == 1
+    database.close()
+
+
+def test_custom_pragmas_extend_default_profile():
+    database = db.SqliteDatabase(':memory:', pragmas={'cache_size': -1000})
+
+    assert _pragma(database, 'cache_size') == -1000
+    assert _pragma(database, 'foreign_keys') == 1
+
+
+def test_unknown_pragmas_profile():
+    with pytest.raises(DbOperationError):
+        db.SqliteDatabase(':memory:', pragmas='unknown')
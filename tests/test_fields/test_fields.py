@@ -1,3 +1,4 @@
+import mock
 import pytest
 
 from ormik import fields, FieldError
@@ -37,3 +38,16 @@ def test_fk_value_should_be_related_model_instance_None_or_int():
     field.__set__(MockModel(), MockModel())  # No error
     with pytest.raises(FieldError):
         field.__set__(MockModel(), 'char_for_example')
+
+
+def test_lazy_fk_stores_pk_without_fetching_related_model():
+    field = fields.ForeignKeyField(
+        name='fk', model=MockModel, reverse_name='fields', lazy=True
+    )
+    instance = MockModel()
+    with mock.patch.object(MockModel, 'get') as get:
+        field.__set__(instance, 1)
+    assert not get.called
+    assert instance.__dict__['fk'] == 1
+    with pytest.raises(FieldError):
+        field.__set__(MockModel(), 'char_for_example')
@@ -1,6 +1,6 @@
 import pytest 
 
-from ormik import fields, models, PkCountError
+from ormik import fields, models, PkCountError, FieldError
 
 
 def test_model_fields_inherits_from_bases(BaseModel):
@@ -29,3 +29,25 @@ def test_model_should_have_no_more_than_one_pk(BaseModel):
         class Model(BaseModel):
             query_manager = 'Mock'
             new_id = fields.IntegerField(primary_key=True)
+
+
+def test_compact_model_stores_fields_in_slots():
+
+    class Model(models.Model):
+        __compact__ = True
+        query_manager = 'Mock'
+        id = fields.AutoField()
+        name = fields.CharField(max_length=3)
+
+    class SubModel(Model):
+        pages = fields.IntegerField()
+
+    model = SubModel(name='abc', pages=10)
+    assert SubModel.__slots__ == ('_field_pages', )
+    assert (model.id, model.name, model.pages) == (None, 'abc', 10)
+    assert dict(model.__dict__) == {'id': None, 'name': 'abc', 'pages': 10}
+    assert SubModel.name is Model._fields['name']
+    with pytest.raises(AttributeError):
+        model.other_attribute = 1
+    with pytest.raises(FieldError):
+        model.name = 'long name'
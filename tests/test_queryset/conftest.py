@@ -0,0 +1,44 @@
+import pytest
+
+from ormik import db, models, fields, sql
+
+
+@pytest.fixture
+def database():
+    return db.SqliteDatabase(':memory:')
+
+
+@pytest.fixture
+def Author(database):
+    class Author(models.Model):
+        id = fields.AutoField()
+        name = fields.CharField()
+
+    database.register_models(Author)
+    Author.create_table()
+    return Author
+
+
+@pytest.fixture
+def Book(database, Author):
+    class Book(models.Model):
+        id = fields.AutoField()
+        author = fields.ForeignKeyField(
+            Author, 'books', is_nullable=True, on_delete=sql.CASCADE
+        )
+        title = fields.CharField(default='Title')
+        pages = fields.IntegerField(default=100)
+
+    database.register_models(Book)
+    Book.create_table()
+    return Book
+
+
+@pytest.fixture
+def queries(database):
+    """ Collect SQL statements executed by the database connection """
+    executed = []
+
+    database.connection.set_trace_callback(executed.append)
+    yield executed
+    database.connection.set_trace_callback(None)
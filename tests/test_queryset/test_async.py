@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from ormik import db, models, fields, DbOperationError
+from ormik.queryset import MANAGER_METHODS, QuerySet
+
+
+@pytest.fixture
+def pooled_database(tmp_path):
+    database = db.PooledSqliteDatabase(
+        str(tmp_path / 'async.db'), max_connections=3, async_workers=2
+    )
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def Author(pooled_database):
+    class Author(models.Model):
+        id = fields.AutoField()
+        name = fields.CharField()
+
+    pooled_database.register_models(Author)
+    Author.create_table()
+    return Author
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_async_queries_run_in_executor(Author):
+    async def main():
+        author = await Author.acreate(name='William Gibson')
+        author.name = 'Bruce Sterling'
+        await author.asave()
+        await asyncio.gather(*[
+            Author.acreate(name=f'Author {i}') for i in range(5)
+        ])
+        return (
+            await Author.filter(id=author.id).aget(),
+            await Author.filter(name__contains='Author').aselect_all()
+        )
+
+    author, authors = _run(main())
+    assert author.name == 'Bruce Sterling'
+    assert len(authors) == 5
+
+
+def test_async_iteration_streams_chunks(Author):
+    Author.bulk_create([Author(name=f'Author {i}') for i in range(7)])
+
+    async def main():
+        return [
+            author.name async for author in
+            Author.filter(id__gt=2).aiter(chunk_size=2)
+        ]
+
+    assert _run(main()) == [f'Author {i}' for i in range(2, 7)]
+
+
+def test_async_queries_need_pooled_database():
+    database = db.SqliteDatabase(':memory:')
+
+    with pytest.raises(DbOperationError):
+        _run(database.run_async(print))
+
+
+def test_async_methods_are_bound_to_model(Author):
+    async_methods = {
+        name for name in dir(QuerySet)
+        if name.startswith('a') and name[1:] in MANAGER_METHODS
+    }
+
+    assert async_methods <= set(MANAGER_METHODS)
+    assert all(hasattr(Author, name) for name in async_methods)
+
+
+def test_async_workers_leave_connection_to_other_threads(tmp_path):
+    database = db.PooledSqliteDatabase(
+        str(tmp_path / 'workers.db'), max_connections=4, timeout=1
+    )
+
+    class Item(models.Model):
+        id = fields.AutoField()
+
+    database.register_models(Item)
+    Item.create_table()
+    database.release()
+
+    async def main():
+        return await asyncio.gather(*[Item.acount() for _ in range(8)])
+
+    assert _run(main()) == [0] * 8
+    assert database.async_workers == 3
+    assert Item.count() == 0
+    database.close()
+
+    with pytest.raises(DbOperationError):
+        db.PooledSqliteDatabase(
+            str(tmp_path / 'workers.db'), max_connections=2, async_workers=2
+        )
+
+
+def test_async_iteration_uses_session_of_caller(pooled_database, Author):
+    author = Author.create(name='William Gibson')
+
+    async def main():
+        return [author async for author in Author.aiter()]
+
+    with pooled_database.identity_map():
+        with pooled_database.capture_queries() as captured:
+            mapped = Author.get(id=author.id)
+            authors = _run(main())
+
+    assert authors == [mapped]
+    assert authors[0] is mapped
+    assert len(captured) == 2
@@ -0,0 +1,91 @@
+import pytest
+
+
+@pytest.fixture
+def gibson(Author):
+    return Author.create(name='William Gibson')
+
+
+def test_same_row_is_the_same_instance(database, Author, Book, gibson, queries):
+    Book.create(author=gibson, title='Neuromancer')
+    Book.create(author=gibson, title='Count Zero')
+
+    with database.identity_map() as identity_map:
+        del queries[:]
+        author = Author.get(id=gibson.id)
+        assert Author.get(id=gibson.id) is author
+        assert len(queries) == 1
+
+        books = Book.select_all()
+        assert books[0].author is author
+        assert books[1].author is author
+        assert Book.filter(title='Neuromancer').get() is books[0]
+        assert len(identity_map) == 3
+        assert len(queries) == 3
+
+    assert Author.get(id=gibson.id) is not author
+
+
+def test_prefetch_skips_mapped_instances(database, Author, Book, gibson, queries):
+    Book.create(author=gibson, title='Neuromancer')
+
+    with database.identity_map():
+        author = Author.get(id=gibson.id)
+        del queries[:]
+        book, = Book.prefetch_related('author').select_all()
+        assert book.author is author
+        assert len(queries) == 1
+
+
+def test_mapped_instance_gets_updates(database, Author, gibson):
+    with database.identity_map() as identity_map:
+        author = Author.get(id=gibson.id)
+
+        other = Author(id=gibson.id, name='Bruce Sterling')
+        other.save()
+        assert author.name == 'Bruce Sterling'
+        assert Author.get(id=gibson.id) is author
+
+        Author.filter(id=gibson.id).update(name='Neal Stephenson')
+        assert author.name == 'Neal Stephenson'
+
+        new_author = Author.create(name='Rudy Rucker')
+        assert Author.get(id=new_author.id) is new_author
+        assert new_author in identity_map
+
+
+def test_deleted_instances_are_discarded(database, Author, Book, gibson):
+    Book.create(author=gibson, title='Neuromancer')
+
+    with database.identity_map() as identity_map:
+        author = Author.get(id=gibson.id)
+        book = Book.get(title='Neuromancer')
+        Author.filter(id=gibson.id).delete()
+
+        assert author not in identity_map
+        assert book not in identity_map  # Deleted CASCADE
+
+
+def test_pending_edits_survive_unrelated_writes(
+    database, Author, Book, gibson, queries
+):
+    Author.create(name='Bruce Sterling')
+    book = Book.create(author=gibson, title='Neuromancer')
+
+    with database.identity_map():
+        author = Author.get(id=gibson.id)
+        book = Book.get(id=book.id)
+        author.name = 'pending'
+        book.pages = 271
+        del queries[:]
+
+        assert Book.filter(id=999).delete() == 0
+        assert Author.filter(id=2).update(name='Neal Stephenson') == 1
+        assert len(queries) == 2
+        assert author.name == 'pending'
+
+        Book.filter(id=book.id).update(title='Count Zero')
+        assert (book.title, book.pages) == ('Count Zero', 271)
+        book.save()
+
+    assert Book.values_list('title', 'pages') == [('Count Zero', 271)]
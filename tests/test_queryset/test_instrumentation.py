@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+
+import pytest
+
+from ormik import db, models, fields
+
+
+@pytest.fixture
+def books(Author, Book):
+    for i in range(3):
+        author = Author.create(name=f'Author {i}')
+        Book.create(author=author, title=f'Book {i}')
+
+
+def test_execute_hooks(database, Author):
+    before, after = [], []
+    database.before_execute(lambda sql, params: before.append(params))
+    hook = database.after_execute(after.append)
+
+    Author.create(name='Jack')
+    database.remove_hook(hook)
+    Author.create(name='John')
+
+    assert before == [('Jack', ), ('John', )]
+    insert, = after
+    assert insert.sql.startswith('INSERT INTO author')
+    assert insert.params == ('Jack', )
+    assert insert.duration > 0
+
+
+def test_capture_queries(database, Author, Book, books):
+    with database.capture_queries() as captured:
+        Book.select_related('author').select_all()
+        Book.filter(title='Book 1').update(pages=10)
+
+    assert len(captured) == 2
+    assert 'LEFT JOIN author' in captured[0].sql
+    assert captured[1].rowcount == 1
+    assert captured.duration >= captured[0].duration
+    assert not database._after_execute_hooks
+
+
+def test_capture_queries_logs_n_plus_one(database, Book, books, caplog):
+    with caplog.at_level(logging.WARNING, logger='ormik'):
+        with database.capture_queries(n_plus_one_threshold=3) as captured:
+            # Eager FK fetches author of each book by one query
+            Book.select_all()
+
+    (sql, count), = captured.repeated(3).items()
+    assert count == 3
+    assert f'executed 3 times: {sql}' in caplog.text
+
+
+def test_log_slow_queries_with_query_plan(database, Book, books, caplog):
+    hook = database.log_slow_queries(threshold=0)
+
+    with caplog.at_level(logging.WARNING, logger='ormik'):
+        list(Book.filter(author=1).values_list('title'))
+    database.remove_hook(hook)
+
+    assert 'Slow query' in caplog.text
+    assert 'USING INDEX book_author_idx' in caplog.text
+
+
+def test_capture_queries_of_calling_thread_only(tmp_path):
+    database = db.PooledSqliteDatabase(
+        str(tmp_path / 'capture.db'), async_workers=1
+    )
+
+    class Item(models.Model):
+        id = fields.AutoField()
+
+    database.register_models(Item)
+    Item.create_table()
+
+    def other_thread_queries():
+        for _ in range(20):
+            Item.count()
+        database.release()
+
+    async def async_count():
+        return await Item.acount()
+
+    with database.capture_queries() as captured:
+        thread = threading.Thread(target=other_thread_queries)
+        thread.start()
+        Item.count()
+        thread.join()
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(async_count())
+        loop.close()
+    database.close()
+
+    assert len(captured) == 2
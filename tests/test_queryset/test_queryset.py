@@ -0,0 +1,615 @@
+from array import array
+
+import mock
+import pytest
+
+from ormik import \
+    FieldError, ObjectDoesNotExistError, QueryError, models, fields
+from ormik.sql import Avg, Count, Max, Min, QuerySQL, Sum
+
+
+@pytest.fixture
+def books(Author, Book):
+    gibson = Author.create(name='William Gibson')
+    sterling = Author.create(name='Bruce Sterling')
+    Book.create(author=gibson, title='Neuromancer', pages=271)
+    Book.create(author=gibson, title='Count Zero', pages=256)
+    Book.create(author=sterling, title='Schismatrix', pages=288)
+    Book.create(title='Anonymous', pages=10)
+
+
+def test_select_related_makes_one_query(Book, books, queries):
+    selected = Book.select_related('author').select_all()
+
+    assert len(queries) == 1
+    assert [book.author.name for book in selected] == [
+        'William Gibson', 'William Gibson', 'Bruce Sterling', None
+    ]
+    assert selected[0].author is selected[1].author
+    assert [book.id for book in selected] == [1, 2, 3, 4]
+
+
+def test_prefetch_related_makes_one_query_per_fk(Book, books, queries):
+    selected = Book.filter(pages__gt=100).prefetch_related(
+        'author'
+    ).select_all()
+
+    assert len(queries) == 2
+    assert [book.author.name for book in selected] == [
+        'William Gibson', 'William Gibson', 'Bruce Sterling'
+    ]
+    assert selected[0].author is selected[1].author
+
+
+def test_get_with_select_related(Book, books, queries):
+    book = Book.select_related('author').get(title='Schismatrix')
+
+    assert len(queries) == 1
+    assert book.author.name == 'Bruce Sterling'
+
+
+def test_select_related_accepts_only_fk(Book):
+    with pytest.raises(QueryError):
+        Book.select_related('title')
+    with pytest.raises(QueryError):
+        Book.prefetch_related('no_field')
+
+
+def test_lazy_fk_fetches_related_model_on_first_access(
+    database, Author, queries
+):
+    class LazyBook(models.Model):
+        id = fields.AutoField()
+        author = fields.ForeignKeyField(Author, 'lazy_books', lazy=True)
+
+    database.register_models(LazyBook)
+    LazyBook.create_table()
+    author = Author.create(name='William Gibson')
+    LazyBook.create(author=author)
+    LazyBook.create(author=None)
+
+    del queries[:]
+    book, anonymous = LazyBook.select_all()
+    assert len(queries) == 1
+    assert book.author_id == author.id
+    assert anonymous.author_id is None
+    assert anonymous.author is None
+    assert len(queries) == 1
+
+    assert book.author.name == 'William Gibson'
+    assert book.author is book.author
+    assert len(queries) == 2
+
+
+def test_values_with_quotes_are_saved_and_filtered(Author):
+    author = Author.create(name="Flann O'Brien")
+
+    assert Author.get(name="Flann O'Brien").id == author.id
+    assert Author.filter(name__contains="O'B").values('name') == [
+        {'name': "Flann O'Brien"}
+    ]
+
+
+def test_bulk_create_sets_autoincremented_pks(Author, Book, queries):
+    author = Author.create(name='William Gibson')
+    Book.create(title='Neuromancer')
+    new_books = [Book(author=author, title=f'Book {i}') for i in range(5)]
+    new_books.append(Book(id=100, title='Explicit pk'))
+
+    del queries[:]
+    created = Book.bulk_create(new_books, batch_size=2)
+
+    assert created == new_books
+    assert [book.id for book in created] == [2, 3, 4, 5, 6, 100]
+    assert not any(q.startswith('SELECT t0') for q in queries)
+    assert Book.get(id=4).title == 'Book 2'
+    assert Book.get(id=4).author.name == 'William Gibson'
+
+
+def test_bulk_create_refresh_reselects_instances(Book, queries):
+    book, = Book.bulk_create([Book(title='Neuromancer')], refresh=True)
+
+    assert book.id == 1
+    assert book.title == 'Neuromancer'
+    assert queries[-1].startswith('SELECT t0.id')
+
+
+def test_bulk_update_updates_only_passed_fields(Book):
+    books = Book.bulk_create([
+        Book(title=f'{i}', pages=i) for i in range(1, 4)
+    ])
+    for book in books:
+        book.title = 'Updated'
+        book.pages = 1000
+
+    assert Book.bulk_update(books, fields=['title']) == 3
+    assert Book.values('title', 'pages') == [
+        {'title': 'Updated', 'pages': i} for i in range(1, 4)
+    ]
+    with pytest.raises(QueryError):
+        Book.bulk_update(books, fields=['no_field'])
+    with pytest.raises(QueryError):
+        Book.bulk_update([Book()], fields=['title'])
+
+
+def test_iterator_fetches_rows_by_chunks(Author, queries):
+    Author.bulk_create([Author(name=f'Author {i}') for i in range(5)])
+
+    del queries[:]
+    authors = Author.filter(id__gt=1).iterator(chunk_size=2)
+    assert not queries
+    assert next(authors).name == 'Author 1'
+    assert [author.name for author in authors] == [
+        'Author 2', 'Author 3', 'Author 4'
+    ]
+    assert len(queries) == 1
+
+    assert list(Author.filter(id__lt=3).values_iterator(
+        'name', chunk_size=1
+    )) == [{'name': 'Author 0'}, {'name': 'Author 1'}]
+
+
+def test_save_updates_only_its_row(Author):
+    gibson = Author.create(name='William Gibson')
+    sterling = Author.create(name='Bruce Sterling')
+
+    gibson.name = 'Neal Stephenson'
+    gibson.save()
+
+    assert gibson.id == 1
+    assert Author.get(id=gibson.id).name == 'Neal Stephenson'
+    assert Author.get(id=sterling.id).name == 'Bruce Sterling'
+
+
+def test_save_updates_only_changed_fields(Author, Book, queries):
+    gibson = Author.create(name='William Gibson')
+    Book.create(author=gibson, title='Neuromancer')
+    book, author = Book.get(id=1), Author.get(id=1)
+    del queries[:]
+
+    book.save()
+    book.author = author
+    book.save(refresh=False)
+    assert queries == []
+
+    book.pages = 271
+    book.save()
+    book.title = 'Count Zero'
+    book.save(refresh=False)
+    book.save()
+
+    assert len(queries) == 2
+    assert queries[0].startswith('UPDATE book SET pages = 271 WHERE')
+    assert queries[1].startswith("UPDATE book SET title = 'Count Zero' WHERE")
+    assert Book.values('title', 'pages') == [
+        {'title': 'Count Zero', 'pages': 271}
+    ]
+
+
+def test_create_without_refresh_takes_snapshot(Author, queries):
+    author = Author.create(name='William Gibson', refresh=False)
+    del queries[:]
+
+    author.save()
+    assert queries == []
+    author.name = 'Bruce Sterling'
+    author.save(refresh=False)
+    assert queries == ["UPDATE author SET name = 'Bruce Sterling' WHERE id = 1"]
+
+
+def test_bulk_create_takes_snapshots(Author, Book, queries):
+    author = Author.create(name='William Gibson')
+    books = Book.bulk_create([
+        Book(author=author, title='Neuromancer'), Book(id=10, author=author)
+    ])
+    del queries[:]
+
+    for book in books:
+        book.save()
+    assert queries == []
+    books[1].pages = 271
+    books[1].save(refresh=False)
+    assert queries == ['UPDATE book SET pages = 271 WHERE id = 10']
+
+
+def test_bulk_update_keeps_snapshot_of_other_fields(Book, books):
+    book = Book.get(id=1)
+    book.title, book.pages = 'Burning Chrome', 191
+    Book.bulk_update([book], ['title'])
+    book.title = 'Neuromancer'
+    book.save()
+
+    assert Book.values_list('title', 'pages')[0] == ('Neuromancer', 191)
+
+
+def test_create_validates_fields(database, Author):
+    class ShortName(models.Model):
+        id = fields.AutoField()
+        name = fields.CharField(max_length=5)
+
+    database.register_models(ShortName)
+    ShortName.create_table()
+
+    for refresh in (True, False):
+        with pytest.raises(FieldError):
+            ShortName.create(name='toolongname', refresh=refresh)
+        with pytest.raises(FieldError):
+            Author.create(name=10, refresh=refresh)
+    assert ShortName.count() == 0
+    assert Author.count() == 0
+
+
+def test_create_and_save_read_back_with_returning(Author, Book, queries):
+    gibson = Author.create(name='William Gibson')
+    book = Book.create(author=gibson, title='Neuromancer')
+    book.pages = 271
+    book.save()
+
+    assert len(queries) == 3
+    assert all('RETURNING' in sql for sql in queries)
+    assert (book.id, book.pages, book.author) == (1, 271, gibson)
+
+
+def test_create_and_save_read_back_without_returning(Author, queries):
+    with mock.patch.object(QuerySQL, 'returning_supported', False):
+        author = Author.create(name='William Gibson')
+        author.name = 'Bruce Sterling'
+        author.save()
+
+    assert len(queries) == 4
+    assert (author.id, author.name) == (1, 'Bruce Sterling')
+
+
+def test_create_and_save_without_refresh(Author, queries):
+    author = Author.create(name='William Gibson', refresh=False)
+    author.name = 'Bruce Sterling'
+    author.save(refresh=False)
+
+    assert len(queries) == 2
+    assert 'RETURNING' not in queries[0]
+    assert (author.id, author.name) == (1, 'Bruce Sterling')
+    assert Author.get(id=1).name == 'Bruce Sterling'
+
+    author.id = 2
+    with pytest.raises(ObjectDoesNotExistError):
+        author.save(refresh=False)
+
+
+def test_create_inserts_values_as_validated_by_fields(Book):
+    book = Book.create(pages=0, refresh=False)
+
+    assert Book.values_list('pages', flat=True) == [book.pages]
+    assert Book.create(pages=0).pages == book.pages
+
+
+def test_selected_rows_bypass_fields_validation(Author, Book):
+    author = Author.create(name='William Gibson')
+    Book.bulk_create([Book(author=author, pages=i) for i in range(1, 4)])
+
+    with mock.patch.object(
+        fields.Field, '__set__', side_effect=AssertionError
+    ):
+        books = Book.select_related('author').select_all()
+
+    assert [book.pages for book in books] == [1, 2, 3]
+    assert books[0].author.name == 'William Gibson'
+
+
+def test_compact_model_queries(database, Author):
+    class CompactBook(models.Model):
+        __compact__ = True
+        id = fields.AutoField()
+        author = fields.ForeignKeyField(Author, 'compact_books')
+        title = fields.CharField(default='Title')
+
+    database.register_models(CompactBook)
+    CompactBook.create_table()
+    author = Author.create(name='William Gibson')
+    book = CompactBook(author=author, title='Neuromancer')
+    book.save()
+    CompactBook.bulk_create([CompactBook(author=author, title='Count Zero')])
+
+    books = CompactBook.select_related('author').select_all()
+    assert [(b.id, b.title, b.author_id) for b in books] == [
+        (1, 'Neuromancer', author.id), (2, 'Count Zero', author.id)
+    ]
+    assert books[0].author.name == 'William Gibson'
+    assert [b.title for b in CompactBook.select_all()] == [
+        'Neuromancer', 'Count Zero'
+    ]
+
+
+def test_values_list(Author, Book):
+    author = Author.create(name='Jack')
+    Book.create(author=author, title='One', pages=10)
+    Book.create(title='Two', pages=20)
+
+    assert Book.values_list('title', 'author__name') == [
+        ('One', 'Jack'), ('Two', None)
+    ]
+    assert Book.filter(pages__gt=10).values_list('title', flat=True) == [
+        'Two'
+    ]
+    book, _ = Book.values_list(named=True)
+    assert (book.title, book.pages, book.author) == ('One', 10, author.id)
+    with pytest.raises(QueryError):
+        Book.values_list('title', 'pages', flat=True)
+
+
+def test_values_columns(Author, Book):
+    author = Author.create(name='Jack')
+    for pages in range(1, 6):
+        Book.create(author=author if pages > 1 else None, pages=pages)
+
+    columns = Book.values_columns(
+        'pages', 'author', 'title', chunk_size=2, use_numpy=False
+    )
+
+    assert columns['pages'] == array('q', [1, 2, 3, 4, 5])
+    assert columns['author'] == [None] + [author.id] * 4
+    assert columns['title'] == ['Title'] * 5
+
+
+def test_count_and_exists(Book, books, queries):
+    assert Book.count() == 4
+    assert Book.filter(author__name='William Gibson').count() == 2
+    assert Book.filter(pages__gt=270).exists()
+    assert not Book.filter(pages__gt=1000).exists()
+    assert queries[-1].endswith('LIMIT 1')
+    assert len(queries) == 4
+
+
+def test_aggregate(Book, books):
+    assert Book.aggregate(
+        books=Count(), pages=Sum('pages'), authors=Count('author', True)
+    ) == {'books': 4, 'pages': 825, 'authors': 2}
+    assert Book.filter(author__name='William Gibson').aggregate(
+        min=Min('pages'), max=Max('pages'), avg=Avg('pages')
+    ) == {'min': 256, 'max': 271, 'avg': 263.5}
+    assert Book.filter(pages__gt=1000).aggregate(
+        pages=Sum('pages')
+    ) == {'pages': None}
+    with pytest.raises(QueryError):
+        Book.filter(pages__gt=100).aggregate()
+
+
+def test_annotate_groups_by_fk_fields(Book, books):
+    assert Book.filter(pages__gt=100).annotate(
+        'author__name', books=Count(), pages=Sum('pages')
+    ) == [
+        {'author__name': 'Bruce Sterling', 'books': 1, 'pages': 288},
+        {'author__name': 'William Gibson', 'books': 2, 'pages': 527},
+    ]
+
+
+def test_slicing_uses_limit_and_offset(Author, queries):
+    for i in range(10):
+        Author.create(name=f'Author {i:02}')
+
+    authors = Author.order_by('-name')[2:8][1:3]
+    assert [author.name for author in authors] == ['Author 06', 'Author 05']
+    assert queries[-1].endswith('ORDER BY t0.name DESC LIMIT 2 OFFSET 3')
+    assert Author.order_by('name')[3].name == 'Author 03'
+    assert [a.name for a in Author.filter(id__gt=8)[1:]] == ['Author 09']
+    with pytest.raises(IndexError):
+        Author.filter(id__gt=8)[5]
+    with pytest.raises(QueryError):
+        Author.filter(id__gt=8)[:5].delete()
+
+
+def test_count_and_exists_of_sliced_queryset(Author):
+    for i in range(10):
+        Author.create(name=f'Author {i}')
+
+    assert Author.filter()[2:5].count() == 3
+    assert Author.order_by('id')[:3].count() == 3
+    assert Author.filter(id__gt=8)[:5].count() == 2
+    assert Author.filter()[20:].count() == 0
+    assert not Author.filter()[:0].exists()
+    assert not Author.filter()[10:].exists()
+    assert Author.filter()[9:].exists()
+    with pytest.raises(QueryError):
+        Author.filter()[:3].aggregate(count=Count())
+    with pytest.raises(QueryError):
+        Author.filter()[:3].annotate('name', count=Count())
+
+
+def test_first_and_last(Book, books):
+    assert Book.first().title == 'Neuromancer'
+    assert Book.last().title == 'Anonymous'
+    assert Book.order_by('author__name', 'pages').last().title == \
+        'Neuromancer'
+    assert Book.filter(pages__gt=1000).first() is None
+
+
+def test_paginate_after(Author, queries):
+    for i in range(7):
+        Author.create(name=f'Author {i}')
+
+    pages, pk = [], None
+    while True:
+        page = Author.filter(name__contains='Author').paginate_after(pk, 3)
+        if not page:
+            break
+        pages.append([author.id for author in page])
+        pk = page[-1].id
+
+    assert pages == [[1, 2, 3], [4, 5, 6], [7]]
+    assert queries[-2].endswith(
+        'AND t0.id > 6 ORDER BY t0.id ASC LIMIT 3'
+    )
+    assert [a.id for a in Author.order_by('-id').paginate_after(3, 5)] == [
+        2, 1
+    ]
+    with pytest.raises(QueryError):
+        Author.order_by('name').paginate_after(3, 5)
+
+
+def test_reverse_relation_lookup_uses_fk_index(database, Author, Book):
+    author = Author.create(name='Jack')
+    query = author.books.query
+    query.append_statement('SELECT')
+    sql, params = query.select_stmt
+    plan = database.connection.execute(
+        f'EXPLAIN QUERY PLAN {sql}', params
+    ).fetchall()
+
+    assert 'USING INDEX book_author_idx' in plan[0]['detail']
+
+
+def test_chaining_returns_clones(Book, books):
+    long_books = Book.filter(pages__gt=100)
+    gibson_books = long_books.filter(author__name='William Gibson')
+    ordered = long_books.order_by('-pages')
+
+    assert gibson_books is not long_books
+    assert [b.title for b in gibson_books] == ['Neuromancer', 'Count Zero']
+    assert [b.title for b in ordered] == [
+        'Schismatrix', 'Neuromancer', 'Count Zero'
+    ]
+    assert long_books.count() == 3
+    assert [b.title for b in long_books.select_all()] == [
+        'Neuromancer', 'Count Zero', 'Schismatrix'
+    ]
+    assert long_books.values_list('title', flat=True)[0] == 'Neuromancer'
+
+
+def test_result_cache(Book, books, queries):
+    long_books = Book.filter(pages__gt=100).prefetch_related('author')
+
+    assert len(long_books) == 3
+    assert long_books
+    assert [b.title for b in long_books][0] == 'Neuromancer'
+    assert long_books[1].title == 'Count Zero'
+    assert long_books.count() == 3
+    assert len(queries) == 2
+
+    assert long_books.filter(pages__gt=1000).exists() is False
+    long_books.update(pages=300)
+    assert [b.pages for b in long_books] == [300] * 3
+    assert len(queries) == 6
+
+
+def test_delete_in_batches_returning_pks(Author, Book, queries):
+    author = Author.create(name='Jack')
+    Book.bulk_create([Book(author=author, pages=i + 1) for i in range(10)])
+    progress = []
+
+    pks = Book.filter(author__name='Jack', pages__gt=2).delete(
+        batch_size=3, progress=progress.append, returning=True
+    )
+
+    assert pks == list(range(3, 11))
+    assert progress == [3, 6, 8]
+    assert Book.values_list('id', flat=True) == [1, 2]
+    deletes = [q for q in queries if q.startswith('DELETE')]
+    assert deletes[0] == (
+        'DELETE FROM book WHERE id IN (SELECT t0.id FROM book AS t0 '
+        'INNER JOIN author AS t1 ON t0.author = t1.id '
+        "WHERE t1.name = 'Jack' AND t0.pages > 2 AND t0.id IN (3, 4, 5)) "
+        'RETURNING id'
+    )
+
+
+def test_update_in_batches_and_joined_update(Author, Book):
+    author = Author.create(name='Jack')
+    Book.bulk_create([Book(author=author, pages=i + 1) for i in range(5)])
+
+    assert Book.filter(pages__gt=1, pages__lt=5).update(
+        batch_size=2, title='Updated'
+    ) == 3
+    assert Book.filter(title='Updated').values_list('id', flat=True) == [
+        2, 3, 4
+    ]
+    assert Book.filter(author__name='Jack').update(
+        pages=7, returning=True
+    ) == [1, 2, 3, 4, 5]
+
+
+def test_batches_modify_only_still_matching_rows(Book, books):
+    def progress(rowcount):
+        Book.filter(id=4).update(pages=10)
+
+    assert Book.filter(pages__gt=100).delete(
+        batch_size=2, progress=progress
+    ) == 3
+    assert Book.values_list('id', 'pages') == [(4, 10)]
+
+
+def test_batch_size_should_be_positive(Book, books):
+    with pytest.raises(QueryError):
+        Book.filter().delete(batch_size=0)
+    with pytest.raises(QueryError):
+        Book.filter().update(batch_size=0, pages=1)
+    assert Book.count() == 4
+
+
+def test_returning_without_sqlite_support(Book, books):
+    with mock.patch.object(QuerySQL, 'returning_supported', False):
+        assert Book.filter(pages__gt=260).delete(returning=True) == [1, 3]
+    assert Book.count() == 2
+
+
+def test_multi_level_lookups_make_one_query(database, queries):
+    class Country(models.Model):
+        id = fields.AutoField()
+        name = fields.CharField()
+
+    class Publisher(models.Model):
+        id = fields.AutoField()
+        country = fields.ForeignKeyField(Country, 'publishers', lazy=True)
+
+    class Writer(models.Model):
+        id = fields.AutoField()
+        publisher = fields.ForeignKeyField(Publisher, 'writers', lazy=True)
+        name = fields.CharField()
+
+    database.register_models([Country, Publisher, Writer])
+    for model in (Country, Publisher, Writer):
+        model.create_table()
+    country = Country.create(name='Canada')
+    publisher = Publisher.create(country=country.id)
+    Writer.create(publisher=publisher.id, name='William Gibson')
+    Writer.create(name='Bruce Sterling')
+    del queries[:]
+
+    assert Writer.filter(publisher__country__name='Canada').values(
+        'name', 'publisher__country__name'
+    ) == [{'name': 'William Gibson', 'publisher__country__name': 'Canada'}]
+    assert Writer.order_by('publisher__country__name').values_list(
+        'name', 'publisher__country__name'
+    ) == [('Bruce Sterling', None), ('William Gibson', 'Canada')]
+    assert len(queries) == 2
+
+
+def test_prefetch_reverse_relations(database, Author, books, queries):
+    class CoBook(models.Model):
+        id = fields.AutoField()
+        author = fields.ForeignKeyField(Author, 'cobooks', lazy=True)
+        coauthor = fields.ForeignKeyField(Author, 'coauthored', lazy=True)
+
+    database.register_models(CoBook)
+    CoBook.create_table()
+    CoBook.create(author=1, coauthor=2)
+    CoBook.create(author=2, coauthor=1)
+    del queries[:]
+
+    authors = list(Author.prefetch_related('books', 'cobooks', 'coauthored'))
+    assert len(queries) == 4
+
+    gibson, sterling = authors
+    assert [b.title for b in gibson.books] == ['Neuromancer', 'Count Zero']
+    assert gibson.books is gibson.books
+    assert all(book.author is gibson for book in gibson.books)
+    assert [b.title for b in sterling.books] == ['Schismatrix']
+    assert [b.id for b in gibson.cobooks] == [1]
+    assert [b.id for b in gibson.coauthored] == [2]
+    assert len(sterling.coauthored) == 1
+    assert len(queries) == 4
+
+    # Filtering prefetched relation queries db
+    assert gibson.books.filter(pages__gt=260).count() == 1
+    assert len(queries) == 5
+
+    with pytest.raises(QueryError):
+        Author.prefetch_related('filter')
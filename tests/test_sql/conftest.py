@@ -0,0 +1,23 @@
+import pytest
+
+from ormik import models, fields
+
+
+@pytest.fixture(scope="module")
+def Author():
+    class Author(models.Model):
+        id = fields.AutoField()
+        name = fields.CharField()
+
+    return Author
+
+
+@pytest.fixture(scope="module")
+def Book(Author):
+    class Book(models.Model):
+        id = fields.AutoField()
+        author = fields.ForeignKeyField(Author, 'books')
+        title = fields.CharField()
+        pages = fields.IntegerField()
+
+    return Book
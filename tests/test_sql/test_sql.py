@@ -0,0 +1,184 @@
+import threading
+
+import pytest
+
+from ormik import FieldError, QueryError, fields, models
+from ormik.sql import Count, Index, QuerySQL, StatementCache, Sum
+
+
+def test_lookup_values_are_passed_as_params(Book):
+    query = QuerySQL(Book)
+    query.append_statement('SELECT', 'title')
+    query.append_statement(
+        'WHERE', title__contains="O'Reilly", pages__in=[1, 2]
+    )
+
+    sql, params = query.select_stmt
+    assert sql == (
+        'SELECT t0.title FROM book AS t0 '
+        'WHERE t0.title LIKE ? AND t0.pages IN (?, ?)'
+    )
+    assert params == ("%O'Reilly%", 1, 2)
+
+
+def test_update_params_follow_set_clause(Book):
+    query = QuerySQL(Book)
+    query.append_statement('UPDATE', id=1, title='New', pages=10)
+    query.append_statement('WHERE', id=1)
+
+    sql, params = query.update_stmt
+    assert sql == 'UPDATE book SET title = ?, pages = ? WHERE id = ?'
+    assert params == ('New', 10, 1)
+
+
+def test_same_query_shape_hits_statement_cache(Book):
+    QuerySQL.statement_cache.clear()
+    for pages in range(3):
+        query = QuerySQL(Book)
+        query.append_statement('SELECT')
+        query.append_statement('WHERE', author__title='T', pages__gt=pages)
+        sql, params = query.select_stmt
+
+    assert params == ('T', 2)
+    assert QuerySQL.statement_cache.misses == 1
+    assert QuerySQL.statement_cache.hits == 2
+
+
+def test_statement_cache_evicts_least_recently_used():
+    cache = StatementCache(maxsize=2)
+    cache.get_or_compile('a', lambda: 'A')
+    cache.get_or_compile('b', lambda: 'B')
+    cache.get_or_compile('a', lambda: 'A')
+    cache.get_or_compile('c', lambda: 'C')
+
+    assert len(cache) == 2
+    assert cache.get_or_compile('a', lambda: 'new A') == 'A'
+    assert cache.get_or_compile('b', lambda: 'new B') == 'new B'
+
+
+def test_statement_cache_is_shared_by_threads():
+    cache = StatementCache(maxsize=4)
+    errors = []
+
+    def use_cache(thread_index):
+        try:
+            for i in range(2000):
+                shape = (thread_index + i) % 6
+                assert cache.get_or_compile(shape, lambda: shape) == shape
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=use_cache, args=(i, )) for i in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(cache) == 4
+    assert cache.hits + cache.misses == 8 * 2000
+
+
+def test_aggregates_with_group_by_join_fk_model(Book):
+    query = QuerySQL(Book)
+    query.append_statement('SELECT', 'author__name', with_fields_alias=True)
+    query.append_aggregates(pages=Sum('pages'), books=Count())
+    query.append_group_by('author__name')
+    query.append_statement('WHERE', pages__gt=10)
+
+    sql, params = query.select_stmt
+    assert sql == (
+        'SELECT t1.name AS author__name, SUM(t0.pages) AS pages, '
+        'COUNT(*) AS books FROM book AS t0 '
+        'LEFT JOIN author AS t1 ON t0.author = t1.id '
+        'WHERE t0.pages > ? GROUP BY t1.name'
+    )
+    assert params == (10, )
+
+
+def test_create_indexes_for_fk_and_declared_indexes(Author):
+    class Review(models.Model):
+        __indexes__ = [
+            ('book', 'rating'), Index('author', 'book', unique=True)
+        ]
+
+        id = fields.AutoField()
+        author = fields.ForeignKeyField(Author, 'reviews')
+        book = fields.CharField(unique=True)
+        rating = fields.IntegerField(index=True)
+        text = fields.CharField()
+
+    assert QuerySQL(Review).create_indexes_stmts == [
+        ('CREATE INDEX IF NOT EXISTS review_author_idx '
+         'ON review (author)', ()),
+        ('CREATE UNIQUE INDEX IF NOT EXISTS review_book_idx '
+         'ON review (book)', ()),
+        ('CREATE INDEX IF NOT EXISTS review_rating_idx '
+         'ON review (rating)', ()),
+        ('CREATE INDEX IF NOT EXISTS review_book_rating_idx '
+         'ON review (book, rating)', ()),
+        ('CREATE UNIQUE INDEX IF NOT EXISTS review_author_book_idx '
+         'ON review (author, book)', ()),
+    ]
+
+
+def test_index_fields_should_be_model_fields():
+    with pytest.raises(FieldError):
+        class Review(models.Model):
+            __indexes__ = [('rating', 'text')]
+
+            id = fields.AutoField()
+            rating = fields.IntegerField()
+
+
+def test_multi_level_fk_paths_reuse_joins():
+    class Country(models.Model):
+        id = fields.AutoField()
+        name = fields.CharField()
+
+    class Publisher(models.Model):
+        id = fields.AutoField()
+        country = fields.ForeignKeyField(
+            Country, 'publishers', is_nullable=False
+        )
+
+    class Writer(models.Model):
+        id = fields.AutoField()
+        publisher = fields.ForeignKeyField(Publisher, 'writers')
+
+    class Novel(models.Model):
+        id = fields.AutoField()
+        writer = fields.ForeignKeyField(Writer, 'novels')
+        title = fields.CharField()
+
+    query = QuerySQL(Novel)
+    query.append_statement(
+        'SELECT', 'title', 'writer__publisher__country__name',
+        with_fields_alias=True
+    )
+    query.append_statement('WHERE', writer__publisher__id__in=[1, 2])
+
+    sql, params = query.select_stmt
+    assert sql == (
+        'SELECT t0.title AS title, '
+        't3.name AS writer__publisher__country__name '
+        'FROM novel AS t0 '
+        'INNER JOIN writer AS t1 ON t0.writer = t1.id '
+        'INNER JOIN publisher AS t2 ON t1.publisher = t2.id '
+        'INNER JOIN country AS t3 ON t2.country = t3.id '
+        'WHERE t2.id IN (?, ?)'
+    )
+    assert params == (1, 2)
+
+    # LEFT JOIN of nullable FK can not be followed by INNER JOIN
+    query = QuerySQL(Novel)
+    query.append_statement('SELECT', 'writer__publisher__country__name')
+    assert query.select_stmt[0].count('LEFT JOIN') == 3
+    query = QuerySQL(Publisher)
+    query.append_statement('SELECT', 'country__name')
+    assert 'INNER JOIN country' in query.select_stmt[0]
+
+    with pytest.raises(QueryError):
+        QuerySQL(Novel).append_statement('WHERE', title__name='T')